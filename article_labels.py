@@ -0,0 +1,216 @@
+import json
+import hashlib
+import logging
+import threading
+from collections import Counter, defaultdict
+
+import sql_manager as sql
+from full_text import FullTextIndex, phrase_tokens
+from rollups import DailyRollups
+
+# One refresh of the labels at a time, whichever ArticleLabels starts it.
+_refresh_lock = threading.Lock()
+
+
+class Classifier:
+    """The main category of a text, the one with the most keyword hits, for one set of filters.
+       Single keywords count whole words, key phrases whole words in a row, as in the inverted and full text indexes."""
+
+    def __init__(self, keywords: list) -> None:
+        """keywords: (keyword, category) pairs, in the order they were added."""
+
+        self.keywords = [tuple(pair) for pair in keywords]
+        self.category_of = dict(self.keywords)
+        self.single = {keyword: category for keyword, category in self.keywords if " " not in keyword}
+        self.phrases = {keyword: category for keyword, category in self.keywords
+                        if " " in keyword and phrase_tokens(keyword)}
+        self.phrases_by_first_word = defaultdict(list)
+        for keyword in self.phrases:
+            tokens = tuple(phrase_tokens(keyword))
+            self.phrases_by_first_word[tokens[0]].append((keyword, tokens))
+        # Ties, and texts without any hits, go to the first category, phrases' categories first.
+        self.categories = list(dict.fromkeys(list(self.phrases.values()) + list(self.single.values())))
+        self.version = hashlib.blake2b(json.dumps([self.categories, sorted(self.keywords)]).encode(),
+                                       digest_size=8).hexdigest()
+
+    def label(self, hits: dict) -> str:
+        """The main category, given the hits of each keyword."""
+
+        if not self.categories:
+            return None
+        category_hits = defaultdict(int)
+        for keyword, count in hits.items():
+            category_hits[self.category_of[keyword]] += count
+        return max(self.categories, key=lambda category: category_hits[category])
+
+    def keyword_hits(self, text: str) -> Counter:
+        """{keyword: hits} of the keywords found in a cleaned text."""
+
+        hits = Counter()
+        for word, count in Counter(text.split()).items():
+            if word in self.single:
+                hits[word] += count
+
+        tokens = phrase_tokens(text)
+        for i, token in enumerate(tokens):
+            for keyword, phrase in self.phrases_by_first_word.get(token, ()):
+                if tuple(tokens[i:i + len(phrase)]) == phrase:
+                    hits[keyword] += 1
+        return hits
+
+    def classify(self, text: str) -> str:
+        return self.label(self.keyword_hits(text))
+
+    def changed_keywords(self, previous: "Classifier") -> set:
+        """Keywords added or removed since the previous filters, whose articles are the only ones that can have
+           changed category. None if the order of the categories changed, which can move any article."""
+
+        if self.categories[:1] != previous.categories[:1]:
+            return None
+        if ([category for category in self.categories if category in previous.categories]
+                != [category for category in previous.categories if category in self.categories]):
+            return None
+        return {keyword for keyword, _ in set(self.keywords) ^ set(previous.keywords)}
+
+
+class ArticleLabels:
+    """The main category of every stored article, in the article_labels table, keyed by article and filter version.
+       Articles are labelled as they are stored. When the filters change, refresh() labels them for the new version,
+       carrying over the labels of articles holding none of the changed keywords.
+       label_versions holds the filters of each version, and whether all articles have been labelled for it.
+       Both tables are created by migration 9."""
+
+    def __init__(self, database: dict, writer: sql.BatchWriter = None) -> None:
+
+        self.db = database
+        # Optional, buffers labels to be written in batches, in order after their article.
+        self.writer = writer
+        self.worker = None
+        # Per day counts of the labels and keyword hits.
+        self.rollups = DailyRollups(self.db, writer)
+        self.classifier = self.current_classifier()
+
+    def current_classifier(self) -> Classifier:
+        return Classifier(sql.execute_query(self.db, """
+                                            SELECT keyword, cat.category FROM keywords
+                                            JOIN categories cat ON category_id = cat.id
+                                            ORDER BY keywords.rowid;"""))
+
+    def add(self, url: str, words: str, date: str = None, duplicate: bool = False) -> None:
+        """Labels an article, stored or about to be by the same writer.
+           Given its scrape date, also counts it into the daily rollups, unless it is a near duplicate."""
+
+        classifier = self.classifier
+        hits = classifier.keyword_hits(words)
+        category = classifier.label(hits)
+        query = ("INSERT OR REPLACE INTO article_labels (version, article_id, category) "
+                 "SELECT ?, rowid, ? FROM articles WHERE url = ?;")
+        params = (classifier.version, category, url)
+        if self.writer:
+            self.writer.add(query, params)
+        else:
+            sql.execute_query(self.db, query, params)
+
+        if date and not duplicate:
+            self.rollups.add(date, hits, classifier.version, category)
+
+    def hits_of_all(self, classifier: Classifier) -> dict:
+        """{article id: {keyword: hits}} of every article with any, from the inverted and full text indexes."""
+
+        hits = defaultdict(Counter)
+        for phrase in classifier.phrases:
+            for article_id, count in FullTextIndex(self.db).phrase_hits(phrase, originals_only=False).items():
+                hits[article_id][phrase] += count
+
+        # CROSS JOIN keeps SQLite to this order: the few keywords first, then their postings only.
+        for article_id, keyword, count in sql.execute_query(self.db, """
+                SELECT p.article_id, k.keyword, p.count FROM keywords k
+                CROSS JOIN terms t ON t.term = k.keyword
+                CROSS JOIN postings p ON p.term_id = t.id;"""):
+            hits[article_id][keyword] += count
+        return hits
+
+    def _affected_articles(self, keywords: set) -> set:
+        """Ids of the articles holding any of the keywords."""
+
+        affected = set()
+        for keyword in keywords:
+            if " " in keyword:
+                affected.update(FullTextIndex(self.db).phrase_articles(keyword))
+            else:
+                affected.update(row[0] for row in sql.execute_query(self.db, """
+                                SELECT p.article_id FROM terms t JOIN postings p ON p.term_id = t.id
+                                WHERE t.term = ?;""", (keyword,)))
+        return affected
+
+    def _classify_texts(self, classifier: Classifier, rows: list) -> list:
+        return [(classifier.version, article_id, classifier.classify(content or "")) for article_id, content in rows]
+
+    def refresh(self) -> str:
+        """Labels every article for the current filters, unless done already. Returns the version."""
+
+        with _refresh_lock:
+            classifier = self.classifier = self.current_classifier()
+            version = classifier.version
+            insert = "INSERT OR REPLACE INTO article_labels (version, article_id, category) VALUES (?, ?, ?);"
+
+            done = sql.execute_query(self.db, "SELECT complete FROM label_versions WHERE version = ?;", (version,))
+            # Daily counts of databases from before they existed.
+            relabelled = not sql.execute_query(self.db, "SELECT 1 FROM daily_category_counts LIMIT 1;")
+            if not (done and done[0][0]):
+                relabelled = True
+                sql.execute_query(self.db, "INSERT OR IGNORE INTO label_versions (version, keywords) VALUES (?, ?);",
+                                  (version, json.dumps(classifier.keywords)))
+                previous = sql.execute_query(self.db, """
+                                             SELECT version, keywords FROM label_versions
+                                             WHERE complete AND version != ? ORDER BY rowid DESC LIMIT 1;""",
+                                             (version,))
+                changed = classifier.changed_keywords(Classifier(json.loads(previous[0][1]))) if previous else None
+
+                if changed is None:
+                    # Everything may have moved, label all articles from the indexes.
+                    hits = self.hits_of_all(classifier)
+                    article_ids = [row[0] for row in sql.execute_query(self.db, "SELECT rowid FROM articles;")]
+                    sql.execute_many(self.db, insert, [(version, article_id, classifier.label(hits[article_id]))
+                                                       for article_id in article_ids])
+                else:
+                    # Carry the labels over, then classify the articles holding a changed keyword again.
+                    affected = self._affected_articles(changed)
+                    sql.execute_query(self.db, """
+                                      INSERT OR REPLACE INTO article_labels (version, article_id, category)
+                                      SELECT ?, article_id, category FROM article_labels WHERE version = ?;""",
+                                      (version, previous[0][0]))
+                    rows = sql.execute_query(self.db, """
+                                             SELECT rowid, decode_content(content) FROM articles
+                                             WHERE rowid IN (SELECT value FROM json_each(?));""",
+                                             (json.dumps(sorted(affected)),))
+                    sql.execute_many(self.db, insert, self._classify_texts(classifier, rows))
+                    logging.info(f"Relabelled {len(affected)} articles for {len(changed)} changed keywords.")
+
+                sql.execute_query(self.db, "UPDATE label_versions SET complete = 1 WHERE version = ?;", (version,))
+                sql.execute_query(self.db, "DELETE FROM article_labels WHERE version != ?;", (version,))
+                sql.execute_query(self.db, "DELETE FROM label_versions WHERE version != ?;", (version,))
+
+            # Articles stored without a label of this version, e.g. by a re-extraction.
+            rows = sql.execute_query(self.db, """
+                                     SELECT rowid, decode_content(content) FROM articles a WHERE NOT EXISTS (
+                                     SELECT 1 FROM article_labels l WHERE l.version = ? AND l.article_id = a.rowid);""",
+                                     (version,))
+            sql.execute_many(self.db, insert, self._classify_texts(classifier, rows))
+
+            if relabelled or rows:
+                self.rollups.rebuild(self)
+            return version
+
+    def refresh_in_background(self) -> threading.Thread:
+        """Runs refresh() on its own thread, e.g. after the filters changed."""
+
+        def refresh():
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(e, exc_info=True)
+
+        self.worker = threading.Thread(target=refresh, name="labels", daemon=True)
+        self.worker.start()
+        return self.worker
@@ -0,0 +1,80 @@
+"""Article texts stored plain against compressed with a trained dictionary: disk size, load and per-article cost.
+
+    python -m benchmarks.content_benchmark --articles 20000
+"""
+import os
+import random
+import string
+import argparse
+import tempfile
+from time import perf_counter
+
+import sql_manager as sql
+from migrations import migrate
+from full_text import FullTextIndex
+from content_codec import ContentCodec, decode
+
+
+def texts(articles: int, words: int) -> list:
+    """Synthetic cleaned articles, their words drawn Zipf-like from a vocabulary of made up words."""
+
+    vocabulary = ["".join(random.choices(string.ascii_lowercase, k=random.randint(2, 12))) for _ in range(30000)]
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    return [" ".join(random.choices(vocabulary, weights, k=words)) for _ in range(articles)]
+
+
+def store(database: dict, articles: list, compressed: bool) -> tuple:
+    """Stores the articles, compressed or plain. Compression is turned on the way content_codec does it, with a
+       dictionary trained on the first articles. Returns the codec and the seconds it took to store the rest."""
+
+    migrate(database)
+    codec = ContentCodec(database)
+    sample = min(ContentCodec.sample_size, len(articles))
+    sql.execute_many(database, "INSERT INTO articles (url, scrape_date, content) VALUES (?, ?, ?);",
+                     [(f"https://site.com/article/{i}", "2023-02-21", articles[i]) for i in range(sample)])
+    if compressed:
+        codec.compress_all()
+    started = perf_counter()
+    for first in range(sample, len(articles), 1000):
+        sql.execute_many(database, "INSERT INTO articles (url, scrape_date, content) VALUES (?, ?, ?);",
+                         [(f"https://site.com/article/{i}", "2023-02-21", codec.encode(articles[i]))
+                          for i in range(first, min(first + 1000, len(articles)))])
+    sql.execute_query(database, "PRAGMA wal_checkpoint(TRUNCATE);")
+    return codec, perf_counter() - started
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark compressed article storage.")
+    parser.add_argument("--articles", type=int, default=20000)
+    parser.add_argument("--words", type=int, default=300, help="Words per article.")
+    args = parser.parse_args()
+
+    random.seed(1)
+    articles = texts(args.articles, args.words)
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ("plain", "compressed"):
+            db = {"database": os.path.join(directory, f"{name}.db")}
+            codec, store_seconds = store(db, articles, name == "compressed")
+            stored = sql.execute_query(db, "SELECT SUM(LENGTH(CAST(content AS BLOB))) FROM articles;")[0][0]
+
+            started = perf_counter()
+            loaded = [row[0] for row in sql.execute_query(db, "SELECT decode_content(content) FROM articles;")]
+            load_seconds = perf_counter() - started
+            assert loaded == articles
+            # The full text index holds the words, not the compressed bytes.
+            last = articles[-1].split()
+            assert len(articles) in FullTextIndex(db).phrase_articles(" ".join(last[:3]))
+
+            sample = articles[:1000]
+            started = perf_counter()
+            values = [codec.encode(text) for text in sample]
+            encode_us = (perf_counter() - started) / len(sample) * 1e6
+            started = perf_counter()
+            for value in values:
+                decode(value)
+            decode_us = (perf_counter() - started) / len(sample) * 1e6
+
+            print(f"{name:10} file {os.path.getsize(db['database']) / 2 ** 20:7.1f} MB  texts {stored / 2 ** 20:6.1f} MB  "
+                  f"store {store_seconds:5.2f}s  load {load_seconds:5.2f}s  "
+                  f"encode {encode_us:5.1f} us  decode {decode_us:5.1f} us per article")
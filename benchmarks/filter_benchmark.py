@@ -0,0 +1,71 @@
+"""Per-link and per-paragraph filtering cost, compiled site profiles against the old raw-string rules.
+
+    python -m benchmarks.filter_benchmark
+"""
+import re
+import random
+from timeit import timeit
+
+from site_profiles import GENERIC_URL_BLACKLIST, load_profiles
+
+
+def legacy_article_url(href: str, base_domain: str, regex_url_match: str, blacklist: list) -> str:
+    """The filtering UrlScraper.generator did before the profiles: one re.search per rule per link."""
+    if not re.search(rf"^/|^https://(www.)?{base_domain}", href):
+        return None
+    if any(re.search(regex, href) for regex in blacklist):
+        return None
+    if regex_url_match and not re.search(regex_url_match, href):
+        return None
+    if href.startswith("/"):
+        href = "https://" + base_domain + href
+    return href
+
+
+def legacy_keeps_paragraph(class_names: list, tag_regex: str, tag_blacklist: list) -> bool:
+    """The per-paragraph work of the old scrape_text, including its re.compile of the tag regex per article."""
+    re.compile(tag_regex)
+    return not any(re.search(filter_tag, name) for name in class_names for filter_tag in tag_blacklist)
+
+
+def sample_links(base_domain: str, count: int) -> list:
+    paths = ["/entry/story-{}", "/article/news-{}", "/2023/02/{}/world/story", "/gallery/pics-{}", "/videos/clip-{}",
+             "/news-story/{}", "/story/2023-02-21/{}", "/liveblog/{}", "/about", "mailto:tips@example.com"]
+    links = []
+    for i in range(count):
+        path = random.choice(paths).format(i)
+        links.append(path if random.random() < 0.7 or path.startswith("mailto") else f"https://www.{base_domain}{path}")
+    return links
+
+
+def sample_class_names(count: int) -> list:
+    names = ["paragraph", "Component-root", "promo-text", "author-card__name", "footer_link", "story-body", "dcr-1"]
+    return [random.sample(names, random.randint(0, 3)) for _ in range(count)]
+
+
+if __name__ == "__main__":
+
+    random.seed(1)
+    rounds = 20
+    links_per_page = 500
+    paragraphs_per_article = 40
+    class_names = sample_class_names(paragraphs_per_article)
+
+    print(f"{'site':12} {'link old':>10} {'link new':>10} {'para old':>10} {'para new':>10}   (ns per item)")
+    for profile in load_profiles():
+        base_domain = profile.base_domains[0]
+        links = sample_links(base_domain, links_per_page)
+        # The old UrlScraper grew its blacklist on every call, this compares against the intended (non-grown) list.
+        blacklist = GENERIC_URL_BLACKLIST + profile.url_blacklist
+
+        link_old = timeit(lambda: [legacy_article_url(href, base_domain, profile.regex_url_match, blacklist)
+                                   for href in links], number=rounds)
+        link_new = timeit(lambda: [profile.article_url(href, base_domain) for href in links], number=rounds)
+        para_old = timeit(lambda: [legacy_keeps_paragraph(names, profile.tag_regex, profile.tag_blacklist)
+                                   for names in class_names], number=rounds)
+        para_new = timeit(lambda: [profile.keeps_paragraph(names) for names in class_names], number=rounds)
+
+        per_link = 1e9 / (rounds * links_per_page)
+        per_paragraph = 1e9 / (rounds * paragraphs_per_article)
+        print(f"{profile.name:12} {link_old * per_link:10.0f} {link_new * per_link:10.0f} "
+              f"{para_old * per_paragraph:10.0f} {para_new * per_paragraph:10.0f}")
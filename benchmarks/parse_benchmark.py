@@ -0,0 +1,76 @@
+"""Parse time and peak memory per page, fast lxml path against the BeautifulSoup path.
+
+Runs over the pages of a recorded fixture file (see scraper_benchmark.py):
+    python -m benchmarks.parse_benchmark --fixtures fixtures.db
+Memory is the tracemalloc peak, i.e. Python allocations only, libxml2's own buffers are not included.
+"""
+import argparse
+import tracemalloc
+from time import perf_counter
+from statistics import median
+
+from http_fixtures import FixtureArchive
+from url_scraper import UrlScraper
+from article_scraper import ArticleScraper
+from site_profiles import load_profiles, profile_for_url
+
+
+def measure(function, *args, repeat: int = 3) -> tuple:
+    """Returns (best seconds, peak bytes) of a call."""
+
+    timings = []
+    for _ in range(repeat):
+        started = perf_counter()
+        try:
+            function(*args)
+        except TypeError:
+            # Pages without a matching article tag still count, both paths do the same work on them.
+            pass
+        timings.append(perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        function(*args)
+    except TypeError:
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak
+
+
+def report(name: str, results: dict) -> None:
+    for path, rows in results.items():
+        if not rows:
+            continue
+        print(f"{name:9} {path:5} pages {len(rows):4d}   median {median(t for t, _ in rows) * 1000:7.2f} ms"
+              f"   peak {median(m for _, m in rows) / 1024:8.0f} KiB (median)   {max(m for _, m in rows) / 1024:8.0f} KiB (max)")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Compare the fast and the BeautifulSoup parse paths.")
+    parser.add_argument("--fixtures", default="fixtures.db", help="Fixture archive file.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    archive = FixtureArchive(args.fixtures)
+    front_pages = {"https://" + url + "/" if "/" not in url else "https://" + url
+                   for profile in load_profiles() for url in profile.urls}
+    rows = archive.connection.execute("SELECT url, body FROM responses WHERE status = 200;").fetchall()
+
+    links = {"fast": [], "soup": []}
+    articles = {"fast": [], "soup": []}
+    for url, body in rows:
+        page = body.decode("utf-8", errors="replace")
+        if url in front_pages:
+            links["fast"].append(measure(UrlScraper.parse_hrefs, page, True, repeat=args.repeat))
+            links["soup"].append(measure(UrlScraper.parse_hrefs, page, False, repeat=args.repeat))
+            continue
+        profile = profile_for_url(url)
+        if profile:
+            for path, fast in (("fast", True), ("soup", False)):
+                articles[path].append(measure(ArticleScraper.extract_text, page, profile, url, fast,
+                                              repeat=args.repeat))
+
+    report("links", links)
+    report("articles", articles)
@@ -0,0 +1,61 @@
+"""Key phrase hit counts, the full text index against re.findall over every article's text.
+
+    python -m benchmarks.phrase_benchmark --articles 100000
+"""
+import os
+import re
+import random
+import argparse
+import tempfile
+from time import perf_counter
+
+import sql_manager as sql
+from migrations import migrate
+from full_text import FullTextIndex
+
+PHRASES = ["climate change", "global warming", "greenhouse gases", "renewable energy", "carbon emissions",
+           "climate crisis", "oil spill", "environmental protection", "ice caps", "environmental justice",
+           "human rights"]
+
+
+def fill(database: dict, articles: int, words: int) -> float:
+    """Stores synthetic cleaned articles, each with a few phrases mixed in. Returns the seconds it took."""
+
+    vocabulary = [f"word{i}" for i in range(20000)] + [word for phrase in PHRASES for word in phrase.split()]
+    started = perf_counter()
+    for first in range(0, articles, 1000):
+        rows = []
+        for i in range(first, min(first + 1000, articles)):
+            text = random.choices(vocabulary, k=words) + random.choices(PHRASES, k=random.randint(0, 3))
+            random.shuffle(text)
+            rows.append((f"https://site.com/article/{i}", "2023-02-21", " ".join(text)))
+        sql.execute_many(database, "INSERT INTO articles (url, scrape_date, content) VALUES (?, ?, ?);", rows)
+    return perf_counter() - started
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark phrase counting.")
+    parser.add_argument("--articles", type=int, default=100000)
+    parser.add_argument("--words", type=int, default=300, help="Words per article.")
+    args = parser.parse_args()
+
+    random.seed(1)
+    with tempfile.TemporaryDirectory() as directory:
+        db = {"database": os.path.join(directory, "phrases.db")}
+        migrate(db)
+        print(f"Stored {args.articles} articles, indexing as they went, in {fill(db, args.articles, args.words):.1f}s.")
+
+        # What Statistics did: load every text, run each phrase's regex over each.
+        started = perf_counter()
+        texts = [row[0] for row in sql.execute_query(db, "SELECT content FROM articles;")]
+        regex_hits = {phrase: sum(len(re.findall(phrase, text)) for text in texts) for phrase in PHRASES}
+        regex_seconds = perf_counter() - started
+
+        started = perf_counter()
+        index = FullTextIndex(db)
+        fts_hits = {phrase: sum(index.phrase_hits(phrase).values()) for phrase in PHRASES}
+        fts_seconds = perf_counter() - started
+
+        print(f"regex  {regex_seconds:7.2f}s  {sum(regex_hits.values())} hits")
+        print(f"fts5   {fts_seconds:7.2f}s  {sum(fts_hits.values())} hits")
@@ -0,0 +1,74 @@
+"""End to end scraper benchmark over recorded HTTP fixtures.
+
+Record the live sites once:
+    python -m benchmarks.scraper_benchmark record --fixtures fixtures.db
+Then compare engines on exactly the same pages, with no network:
+    python -m benchmarks.scraper_benchmark replay --fixtures fixtures.db --latency 0.1 --workers 1 4 8
+Add --parse-workers 0 3 to compare extracting in the fetch threads with a pool of parse processes.
+"""
+import os
+import argparse
+import tempfile
+from time import perf_counter
+from datetime import datetime
+
+import sql_manager as sql
+from site_profiles import load_profiles
+from http_client import HttpClient
+from text_cleaner import TextCleaner
+from scrape_engine import ScrapeEngine
+from rate_limiter import DomainRateLimiter
+
+
+def run_pipeline(engine: ScrapeEngine, database: dict) -> dict:
+    """Runs discovery, fetching, cleaning and storing like NewsBot2000.run_scraper, without the curses UI."""
+
+    for query in (
+        "CREATE TABLE articles(url TEXT PRIMARY KEY, scrape_date DATETIME, content TEXT)",
+        "CREATE TABLE failed_scrapes(url TEXT PRIMARY KEY, scrape_date DATETIME, error_message TEXT)"
+    ):
+        sql.execute_query(database, query)
+
+    text_cleaner = TextCleaner()
+    started = perf_counter()
+    for result in engine.run(load_profiles(), set()):
+        if result.error or not result.text:
+            sql.execute_query(database, "INSERT INTO failed_scrapes (url, scrape_date, error_message) VALUES (?, ?, ?);",
+                              (result.url, str(datetime.now().date()), str(result.error or "No text found")))
+            continue
+        words = result.words if result.words is not None else text_cleaner.clean_text(result.text)
+        sql.execute_query(database, "INSERT INTO articles (url, scrape_date, content) VALUES (?, ?, ?);",
+                          (result.url, str(datetime.now().date()), words))
+    elapsed = perf_counter() - started
+
+    return {"workers": engine.max_workers, "parse_workers": engine.parse_workers,
+            "articles": engine.scraped, "failed": engine.failed,
+            "seconds": round(elapsed, 2), "articles_per_second": round(engine.scraped / elapsed, 2),
+            "utilisation": {stage: round(share, 2) for stage, share in engine.utilisation().items()}}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the scrape pipeline on recorded HTTP fixtures.")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--fixtures", default="fixtures.db", help="Fixture archive file.")
+    parser.add_argument("--latency", type=float, default=0.1, help="Injected seconds per replayed request.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8], help="Engine sizes to compare.")
+    parser.add_argument("--per-domain", type=int, default=2)
+    parser.add_argument("--parse-workers", type=int, nargs="+", default=[0], help="Parse stage sizes to compare.")
+    args = parser.parse_args()
+
+    sizes = [(workers, parse_workers) for workers in args.workers for parse_workers in args.parse_workers]
+    for workers, parse_workers in sizes if args.mode == "replay" else sizes[-1:]:
+        if args.mode == "record":
+            # Live and polite, with the default rate limits.
+            client = HttpClient(pool_maxsize=args.per_domain, fixture_mode="record", fixture_path=args.fixtures)
+        else:
+            # No rate limits when replaying, only the injected latency.
+            client = HttpClient(limiter=DomainRateLimiter(initial_rate=1000, max_rate=1000, burst=1000),
+                                fixture_mode="replay", fixture_path=args.fixtures, replay_latency=args.latency)
+
+        engine = ScrapeEngine(max_workers=workers, per_domain=args.per_domain, client=client,
+                              parse_workers=parse_workers)
+        with tempfile.TemporaryDirectory() as directory:
+            print(run_pipeline(engine, {"database": os.path.join(directory, "bench.db")}))
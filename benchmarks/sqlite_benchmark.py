@@ -0,0 +1,87 @@
+"""Inserts and queries per second through sql_manager, against the old connection-per-statement manager.
+
+    python -m benchmarks.sqlite_benchmark --rows 2000 --threads 4
+"""
+import os
+import sqlite3
+import argparse
+import tempfile
+import threading
+from time import perf_counter
+
+import sql_manager as sql
+
+
+class LegacyConnectionManager:
+    """The old sql_manager: a new connection, BEGIN and PRAGMA foreign_keys for every statement."""
+
+    def __init__(self, database: dict):
+        self.database = database
+
+    def __enter__(self):
+        self.connection = sqlite3.connect(**self.database)
+        self.cursor = self.connection.cursor()
+        self.cursor.execute("BEGIN;")
+        self.cursor.execute('PRAGMA foreign_keys = True;')
+        return self
+
+    def __exit__(self, exc_class, exc, traceback):
+        try:
+            self.connection.commit()
+        finally:
+            self.connection.close()
+
+
+def legacy_execute_query(database: dict, query: str, params: tuple = ()):
+    with LegacyConnectionManager(database) as cm:
+        cm.cursor.execute(query, params)
+        return cm.cursor.fetchall()
+
+
+def run(execute, database: dict, rows: int, threads: int) -> dict:
+    execute(database, "CREATE TABLE articles(url TEXT PRIMARY KEY, scrape_date DATETIME, content TEXT);")
+    content = "word " * 500
+
+    started = perf_counter()
+    for i in range(rows):
+        execute(database, "INSERT INTO articles (url, scrape_date, content) VALUES (?, ?, ?);",
+                (f"https://site.com/article/{i}", "2023-02-21", content))
+    inserts = rows / (perf_counter() - started)
+
+    started = perf_counter()
+    for i in range(rows):
+        execute(database, "SELECT 1 FROM articles WHERE url = ?;", (f"https://site.com/article/{i}",))
+    queries = rows / (perf_counter() - started)
+
+    # Readers and one writer at the same time, like the scrape thread and the interface.
+    def reader():
+        for i in range(rows):
+            execute(database, "SELECT 1 FROM articles WHERE url = ?;", (f"https://site.com/article/{i}",))
+
+    def writer():
+        for i in range(rows // 4):
+            execute(database, "INSERT INTO articles (url, scrape_date, content) VALUES (?, ?, ?);",
+                    (f"https://site.com/concurrent/{i}", "2023-02-21", content))
+
+    workers = [threading.Thread(target=reader) for _ in range(threads)] + [threading.Thread(target=writer)]
+    started = perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    mixed = (rows * threads + rows // 4) / (perf_counter() - started)
+
+    return {"inserts/s": round(inserts), "queries/s": round(queries), "mixed statements/s": round(mixed)}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the SQLite connection layer.")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4, help="Reader threads in the mixed run.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, execute in (("before", legacy_execute_query), ("after", sql.execute_query)):
+            database = {"database": os.path.join(directory, f"{name}.db")}
+            print(f"{name:7}", run(execute, database, args.rows, args.threads))
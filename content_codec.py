@@ -0,0 +1,200 @@
+"""Optional compressed storage of articles.content: zlib with a dictionary trained on the database's own articles.
+
+    python -m content_codec --database data.db --compress
+    python -m content_codec --database data.db --decompress
+
+Compressed texts are stored as BLOBs starting with MAGIC and the id of their dictionary, plain texts stay TEXT,
+so both can live in one table. Read them through the decode_content() SQL function, or the articles_text view.
+Until compression is turned on, the schema doesn't use decode_content(), so any sqlite3 connection can write articles.
+The file keeps its size after compressing, the freed pages are reused by new articles. Don't VACUUM it to shrink it:
+that renumbers the article rowids the indexes refer to.
+"""
+import zlib
+import hashlib
+import argparse
+from collections import Counter
+from datetime import datetime
+from time import perf_counter
+
+import sql_manager as sql
+
+MAGIC = b"\x1fZ"
+ID_SIZE = 4
+# zlib looks back at most 32 kB, a longer dictionary would never be used.
+DICTIONARY_SIZE = 32768
+LEVEL = 6
+
+# Dictionaries by id, shared by all connections.
+_dictionaries = {}
+
+
+def train_dictionary(texts: list, size: int = DICTIONARY_SIZE) -> bytes:
+    """A zlib dictionary of the words that save the most bytes across the sample texts.
+       Most valuable last, where zlib reaches them with the shortest distances."""
+
+    counts = Counter(word for text in texts for word in text.split())
+    dictionary = []
+    length = 0
+    for word, _ in sorted(counts.items(), key=lambda item: item[1] * len(item[0]), reverse=True):
+        if length + len(word) + 1 > size:
+            break
+        dictionary.append(word)
+        length += len(word) + 1
+    return " ".join(reversed(dictionary)).encode() + b" "
+
+
+def dictionary_id(dictionary: bytes) -> bytes:
+    return hashlib.blake2b(dictionary, digest_size=ID_SIZE).digest()
+
+
+def compress(text: str, dictionary: bytes) -> bytes:
+    compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, -15, zdict=dictionary)
+    return MAGIC + dictionary_id(dictionary) + compressor.compress(text.encode()) + compressor.flush()
+
+
+def decode(value, dictionary_lookup=_dictionaries.get):
+    """The text of a stored content value, compressed or not."""
+
+    if not isinstance(value, bytes):
+        return value
+    if not value.startswith(MAGIC):
+        return value.decode()
+    dictionary = dictionary_lookup(value[len(MAGIC):len(MAGIC) + ID_SIZE])
+    decompressor = zlib.decompressobj(-15, zdict=dictionary)
+    return (decompressor.decompress(value[len(MAGIC) + ID_SIZE:]) + decompressor.flush()).decode()
+
+
+def _decode_content_function(connection):
+    """decode_content(content) for one connection, loading dictionaries it hasn't seen from that database."""
+
+    def lookup(key: bytes) -> bytes:
+        if key not in _dictionaries:
+            row = connection.execute("SELECT dictionary FROM content_dictionaries WHERE id = ?;", (key,)).fetchone()
+            if row is None:
+                raise ValueError(f"No content dictionary {key.hex()}")
+            _dictionaries[key] = row[0]
+        return _dictionaries[key]
+
+    return lambda value: decode(value, lookup)
+
+
+sql.register_function("decode_content", 1, _decode_content_function)
+
+
+def index_texts(cursor, compressed: bool = None) -> None:
+    """(Re)creates the articles_text view and the triggers feeding the full text index from it: through
+       decode_content() if compressed, on the columns themselves if not, so the schema works without the function.
+       compressed: by default, whether the database has a dictionary."""
+
+    if compressed is None:
+        compressed = cursor.execute("SELECT 1 FROM content_dictionaries LIMIT 1;").fetchone() is not None
+    text = "decode_content({}.content)" if compressed else "{}.content"
+    new, old = text.format("new"), text.format("old")
+
+    for trigger in ("articles_fts_insert", "articles_fts_delete", "articles_fts_update"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+    cursor.execute("DROP VIEW IF EXISTS articles_text;")
+    cursor.execute(f"""
+                   CREATE VIEW articles_text AS
+                   SELECT rowid AS id, url, scrape_date, {text.format("articles")} AS content, duplicate_of
+                   FROM articles;""")
+    cursor.execute(f"""
+                   CREATE TRIGGER articles_fts_insert AFTER INSERT ON articles BEGIN
+                   INSERT INTO articles_fts (rowid, content) VALUES (new.rowid, {new});
+                   END;""")
+    cursor.execute(f"""
+                   CREATE TRIGGER articles_fts_delete AFTER DELETE ON articles BEGIN
+                   INSERT INTO articles_fts (articles_fts, rowid, content) VALUES ('delete', old.rowid, {old});
+                   END;""")
+    # Compressing or decompressing an article changes its content but not its text, which needs no reindexing.
+    cursor.execute(f"""
+                   CREATE TRIGGER articles_fts_update AFTER UPDATE OF content ON articles WHEN {old} IS NOT {new} BEGIN
+                   INSERT INTO articles_fts (articles_fts, rowid, content) VALUES ('delete', old.rowid, {old});
+                   INSERT INTO articles_fts (rowid, content) VALUES (new.rowid, {new});
+                   END;""")
+
+
+class ContentCodec:
+    """Encodes article texts for storage in articles.content: compressed with the database's newest dictionary
+       if it has one, i.e. if compression was turned on with compress_all(), otherwise as plain text."""
+
+    # Articles per transaction when converting a database.
+    batch = 500
+    # Articles the dictionary is trained on.
+    sample_size = 2000
+
+    def __init__(self, database: dict) -> None:
+
+        self.db = database
+        # The table itself is created by migrations.
+        rows = sql.execute_query(self.db, "SELECT id, dictionary FROM content_dictionaries ORDER BY created DESC LIMIT 1;")
+        self.dictionary = rows[0][1] if rows else None
+        if self.dictionary:
+            _dictionaries[rows[0][0]] = self.dictionary
+
+    def encode(self, text: str):
+        """The value to store for a text: a compressed BLOB, or the text itself if compression is off."""
+        if not self.dictionary or not text:
+            return text
+        return compress(text, self.dictionary)
+
+    def _convert(self, encode) -> int:
+        """Rewrites every article's content with encode(text), a batch at a time. Returns how many were rewritten."""
+
+        converted = 0
+        last_rowid = 0
+        while True:
+            rows = sql.execute_query(self.db, """
+                                     SELECT rowid, decode_content(content) FROM articles
+                                     WHERE rowid > ? ORDER BY rowid LIMIT ?;""", (last_rowid, self.batch))
+            if not rows:
+                return converted
+            # The FTS trigger skips rows whose text didn't change, so only the content is rewritten.
+            sql.execute_many(self.db, "UPDATE articles SET content = ? WHERE rowid = ?;",
+                             [(encode(text), rowid) for rowid, text in rows])
+            converted += len(rows)
+            last_rowid = rows[-1][0]
+
+    def compress_all(self) -> int:
+        """Trains a dictionary on a sample of the stored articles, and compresses every article with it."""
+
+        sample = [row[0] for row in sql.execute_query(self.db, """
+                  SELECT decode_content(content) FROM articles WHERE content != ''
+                  ORDER BY random() LIMIT ?;""", (self.sample_size,))]
+        dictionary = train_dictionary(sample)
+        with sql.ConnectionManager(self.db) as cm:
+            cm.cursor.execute("INSERT OR REPLACE INTO content_dictionaries (id, dictionary, created) VALUES (?, ?, ?);",
+                              (dictionary_id(dictionary), dictionary, datetime.now().isoformat(sep=" ")))
+            # Before any BLOB is written, which the full text index must read decoded.
+            index_texts(cm.cursor, compressed=True)
+        _dictionaries[dictionary_id(dictionary)] = self.dictionary = dictionary
+        return self._convert(self.encode)
+
+    def decompress_all(self) -> int:
+        """Turns compression off, storing every article as plain text again."""
+
+        converted = self._convert(lambda text: text)
+        with sql.ConnectionManager(self.db) as cm:
+            index_texts(cm.cursor, compressed=False)
+            cm.cursor.execute("DELETE FROM content_dictionaries;")
+        self.dictionary = None
+        return converted
+
+
+if __name__ == "__main__":
+
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Compress or decompress the stored article texts.")
+    parser.add_argument("--database", default="data.db")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--compress", action="store_true", help="Train a dictionary and compress every article.")
+    mode.add_argument("--decompress", action="store_true", help="Store every article as plain text again.")
+    args = parser.parse_args()
+
+    db = {"database": args.database}
+    migrate(db)
+    codec = ContentCodec(db)
+    started = perf_counter()
+    converted = codec.compress_all() if args.compress else codec.decompress_all()
+    print(f"Converted {converted} articles in {perf_counter() - started:.1f}s.")
@@ -0,0 +1,68 @@
+import re
+from lxml import etree, html as lxml_html
+
+# Size of the pieces fed to the incremental parser.
+CHUNK_SIZE = 64 * 1024
+
+
+def _parse_events(page: str):
+    """Feeds a page to lxml's incremental HTML parser piece by piece, yielding (event, element) as tags open and close."""
+
+    # lxml refuses documents without a single tag, like the empty body of an error page.
+    if not page or not page.strip():
+        return
+
+    parser = etree.HTMLPullParser(events=("start", "end"))
+    for start in range(0, len(page), CHUNK_SIZE):
+        parser.feed(page[start:start + CHUNK_SIZE])
+        yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
+
+
+def iter_hrefs(page: str):
+    """Yields the href of every tag on a page, like BeautifulSoup's find_all(href=True), without building a soup.
+       Finished elements are dropped while parsing, so memory stays flat."""
+
+    for event, element in _parse_events(page):
+        if event == "start":
+            href = element.get("href")
+            if href is not None:
+                yield href
+        else:
+            # Done with this element, free it and any earlier siblings.
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+def _matches(value: str, tag_regex: re.Pattern) -> bool:
+    """Same rule as BeautifulSoup's class_/id regex match: any single value, or the whole attribute."""
+    if not value:
+        return False
+    return any(tag_regex.search(part) for part in value.split()) or bool(tag_regex.search(value))
+
+
+def article_fragment(page: str, tag_regex: str) -> str:
+    """Returns the HTML of the article body only: the first tag whose class matches tag_regex,
+       or failing that the first tag whose id does. Parsing stops as soon as a class match is complete.
+       None if nothing matches."""
+
+    tag_regex = re.compile(tag_regex)
+    class_match = None
+    id_match = None
+
+    for event, element in _parse_events(page):
+        if event == "start":
+            if class_match is None and _matches(element.get("class"), tag_regex):
+                class_match = element
+            elif id_match is None and _matches(element.get("id"), tag_regex):
+                id_match = element
+        elif element is class_match:
+            # The article tag is complete, no need to parse the rest of the page.
+            break
+
+    target = class_match if class_match is not None else id_match
+    if target is None:
+        return None
+    return lxml_html.tostring(target, encoding="unicode", with_tail=False)
@@ -0,0 +1,210 @@
+import re
+import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from lxml import etree
+
+import sql_manager as sql
+from http_client import HttpClient, shared_client
+from fast_parse import CHUNK_SIZE
+from site_profiles import SiteProfile
+
+# Elements holding one article (RSS item, Atom entry, sitemap url) or one child sitemap of a sitemap index.
+ENTRY_TAGS = ("item", "entry", "url", "sitemap")
+# Date elements, most specific first: news sitemap publication date, RSS, Atom, plain sitemap.
+DATE_TAGS = ("publication_date", "pubDate", "published", "updated", "lastmod", "date")
+
+
+def parse_feed_date(value: str) -> str:
+    """Returns an ISO 8601 or RFC 822 feed date as "YYYY-MM-DD HH:MM:SS" in UTC, or None if it can't be read."""
+
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        date = datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date.isoformat(sep=" ", timespec="seconds")
+
+
+def _local_name(element) -> str:
+    """Tag name without its XML namespace."""
+    return etree.QName(element).localname if isinstance(element.tag, str) else ""
+
+
+def _entry_link(element) -> str:
+    """The entry's own <loc> or <link>, not one nested deeper such as the <image:loc> of a sitemap image."""
+    for child in element:
+        name = _local_name(child)
+        if name == "loc" or (name == "link" and child.text and child.text.strip()):
+            return child.text.strip()
+        if name == "link" and child.get("href") and child.get("rel", "alternate") == "alternate":
+            return child.get("href")
+    return None
+
+
+def _entry_date(element) -> str:
+    dates = {_local_name(child): child.text for child in element.iter() if _local_name(child) in DATE_TAGS}
+    for name in DATE_TAGS:
+        if name in dates:
+            return parse_feed_date(dates[name])
+    return None
+
+
+def iter_feed_entries(chunks):
+    """Streams an RSS, Atom or sitemap document, yielding (kind, link, published) per entry as it is parsed.
+       kind is "sitemap" for the children of a sitemap index, otherwise "article". Finished entries are dropped."""
+
+    parser = etree.XMLPullParser(events=("end",), recover=True, resolve_entities=False, no_network=True)
+
+    def entries():
+        for _, element in parser.read_events():
+            name = _local_name(element)
+            if name not in ENTRY_TAGS:
+                continue
+            link = _entry_link(element)
+            if link:
+                yield ("sitemap" if name == "sitemap" else "article"), link, _entry_date(element)
+            # Done with this entry, free it and any earlier siblings.
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from entries()
+    parser.close()
+    yield from entries()
+
+
+class FeedState:
+    """Per-feed state of the last run, stored in the database: validators for conditional requests
+       and the newest publication date seen, so each run only yields articles published since.
+       The state read by a run is only saved once the run finished, so the articles of a cancelled or crashed run
+       are found again. Also keeps the publication date of every article found in a feed."""
+
+    def __init__(self, database: dict) -> None:
+
+        self.db = database
+        sql.execute_query(self.db, """
+                          CREATE TABLE IF NOT EXISTS feed_state(
+                          url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, last_published DATETIME);""")
+        sql.execute_query(self.db, """
+                          CREATE TABLE IF NOT EXISTS published_dates(
+                          url TEXT PRIMARY KEY, published DATETIME) WITHOUT ROWID;""")
+        # New state of the feeds read by the current run, by url.
+        self._pending = {}
+
+    def lookup(self, url: str) -> dict:
+        rows = sql.execute_query(
+            self.db, "SELECT etag, last_modified, last_published FROM feed_state WHERE url = ?;", (url,))
+        if not rows:
+            return None
+        etag, last_modified, last_published = rows[0]
+        return {"etag": etag, "last_modified": last_modified, "last_published": last_published}
+
+    def store(self, url: str, response, last_published: str) -> None:
+        """Keeps the new state of a feed, until save()."""
+        self._pending[url] = (url, response.headers.get("ETag"), response.headers.get("Last-Modified"), last_published)
+
+    def save(self) -> None:
+        """Saves the state of the feeds read since the last save() or discard(), once their articles are scraped."""
+        sql.execute_many(self.db, """
+                         INSERT OR REPLACE INTO feed_state (url, etag, last_modified, last_published)
+                         VALUES (?, ?, ?, ?);""", list(self._pending.values()))
+        self._pending.clear()
+
+    def discard(self) -> None:
+        """Forgets the state of the feeds read by an unfinished run."""
+        self._pending.clear()
+
+    def store_dates(self, entries: list) -> None:
+        """Stores (url, published) of articles found in a feed."""
+        sql.execute_many(self.db, "INSERT OR REPLACE INTO published_dates (url, published) VALUES (?, ?);", entries)
+
+
+class FeedScraper:
+    """Finds new article urls in a site's RSS feeds and news sitemaps, instead of crawling its front pages.
+       Feeds are parsed as they stream in and only list fresh articles, so discovery costs a fraction of the bytes."""
+
+    # How deep to follow sitemap indexes into their child sitemaps.
+    max_depth = 1
+
+    def __init__(self, client: HttpClient = None, state: FeedState = None) -> None:
+        # All scrapers share one pooled HTTP client unless given their own.
+        self.client = client or shared_client
+        # Optional last-run state, without it every listed article is yielded.
+        self.state = state
+
+    def _read_feed(self, feed_url: str, depth: int = 0) -> list:
+        """Returns (url, published) of articles newer than the last run of a feed. Raises on unreadable feeds."""
+
+        last = self.state.lookup(feed_url) if self.state else None
+        last_published = last["last_published"] if last else None
+        headers = {}
+        if last and last["etag"]:
+            headers["If-None-Match"] = last["etag"]
+        if last and last["last_modified"]:
+            headers["If-Modified-Since"] = last["last_modified"]
+
+        articles = []
+        newest = last_published
+        with self.client.get(feed_url, headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                return []
+            if response.status_code != 200:
+                raise ValueError(f"{response.status_code} {feed_url}")
+
+            found = False
+            for kind, link, published in iter_feed_entries(response.iter_content(CHUNK_SIZE)):
+                found = True
+                # Undated entries are always passed on, the seen-url index filters those already stored.
+                if published and last_published and published <= last_published:
+                    continue
+                if published and (newest is None or published > newest):
+                    newest = published
+                if kind == "sitemap":
+                    if depth < self.max_depth:
+                        articles.extend(self._read_feed(link, depth + 1))
+                else:
+                    articles.append((link, published))
+
+            if not found:
+                raise ValueError(f"No entries found in {feed_url}")
+
+        if self.state:
+            self.state.store(feed_url, response, newest)
+        return articles
+
+    def discover(self, profile: SiteProfile) -> list:
+        """Returns the article urls of all the site's feeds that are new since the last run,
+           filtered by the site's url rules. None if no feed could be read, to fall back on the front pages."""
+
+        urls = []
+        dates = []
+        feeds_read = 0
+        for feed_url in profile.feeds:
+            try:
+                articles = self._read_feed(feed_url)
+            except Exception as e:
+                logging.warning(f"Feed {feed_url} failed: {e}")
+                continue
+            feeds_read += 1
+
+            for link, published in articles:
+                base_domain = re.sub(r"^https?://(www\.)?|/.*", "", link)
+                url = profile.article_url(link, base_domain)
+                if url:
+                    urls.append(url)
+                    if published:
+                        dates.append((url, published))
+
+        if self.state and dates:
+            self.state.store_dates(dates)
+        return urls if feeds_read else None
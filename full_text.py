@@ -0,0 +1,57 @@
+import re
+import argparse
+
+import sql_manager as sql
+from migrations import migrate
+
+
+def phrase_tokens(phrase: str) -> list:
+    """The terms of a phrase as the FTS5 unicode61 tokenizer sees them."""
+    return re.findall(r"\w+", phrase.lower())
+
+
+class FullTextIndex:
+    """Queries on articles_fts, the FTS5 index of the article texts (the articles_text view, see content_codec)
+       created by migrations and kept in step by triggers.
+       Phrases are matched on whole words, from the index, without reading any article text."""
+
+    def __init__(self, database: dict) -> None:
+        self.db = database
+
+    def phrase_articles(self, phrase: str) -> list:
+        """Rowids of the articles holding the phrase."""
+        match = '"' + " ".join(phrase_tokens(phrase)) + '"'
+        return [row[0] for row in sql.execute_query(
+            self.db, "SELECT rowid FROM articles_fts WHERE articles_fts MATCH ?;", (match,))]
+
+    def phrase_hits(self, phrase: str, originals_only: bool = True) -> dict:
+        """{article rowid: times the phrase occurs in it}, for the articles holding it. Counted by joining the
+           positions of each word with those of the next, so a word only counts where it follows the one before."""
+
+        tokens = phrase_tokens(phrase)
+        if not tokens:
+            return {}
+        # Materialized, so each word's positions are read from the index once and joined on an automatic index.
+        words = ", ".join(f"w{i} AS MATERIALIZED (SELECT doc, offset FROM articles_fts_instances WHERE term = ?)"
+                          for i in range(len(tokens)))
+        joins = " ".join(f"JOIN w{i} ON w{i}.doc = w0.doc AND w{i}.offset = w0.offset + {i}"
+                         for i in range(1, len(tokens)))
+        originals = "JOIN articles a ON a.rowid = w0.doc AND a.duplicate_of IS NULL" if originals_only else ""
+        return dict(sql.execute_query(
+            self.db, f"WITH {words} SELECT w0.doc, COUNT(*) FROM w0 {joins} {originals} GROUP BY w0.doc;", tokens))
+
+    def rebuild(self) -> None:
+        """Indexes all article texts again, from scratch."""
+        sql.execute_query(self.db, "INSERT INTO articles_fts (articles_fts) VALUES ('rebuild');")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Rebuild the full text index of the stored articles.")
+    parser.add_argument("--database", default="data.db")
+    args = parser.parse_args()
+
+    db = {"database": args.database}
+    migrate(db)
+    FullTextIndex(db).rebuild()
+    print("Rebuilt articles_fts.")
@@ -1,88 +1,80 @@
-from collections import defaultdict
 import pandas as pd
-import re
 import logging
 
 import sql_manager as sql
+from full_text import FullTextIndex
+from article_labels import ArticleLabels
 
 
 class Statistics:
-    """Uses Pandas to sift through and analyze data."""
+    """Uses Pandas to sift through and analyze data.
+       Keyword hits are summed in SQL from the inverted index, see InvertedIndex, and key phrases counted
+       by the full text index, instead of recounted in Python."""
 
-    def __init__(self, database):
+    def __init__(self, database, exclude_duplicates: bool = True):
 
         self.db = database
-
-        # Articles from sql table
-        self.articles_sql = sql.execute_query(self.db, "SELECT * FROM articles;")
-        # Dataframe from articles table in sql database
-        self.df_articles = pd.DataFrame(self.articles_sql, columns=["url", "date", "text"])
-        # Create a single list of all article words, not changing their original order within the texts
-        self.article_texts_list = (article[2].split() for article in self.articles_sql)
-        # All articles' words in a list
-        self.articles_words_list = (word for lst in self.article_texts_list for word in lst)
+        self.full_text = FullTextIndex(self.db)
+        # Main category of every article, labelled as stored and again in the background when the filters change.
+        self.labels = ArticleLabels(self.db)
+        self.exclude_duplicates = exclude_duplicates
+        # Leaves out near duplicates of other articles unless asked for.
+        self.originals_only = "AND a.duplicate_of IS NULL" if exclude_duplicates else ""
 
         # Text filters from sql table
         self.keywords_sql = sql.execute_query(self.db, """
                                   SELECT keyword, cat.category FROM keywords
                                   JOIN categories cat ON category_id = cat.id;""")
 
-        # Keywords consisting of a single word.
-        self.single_keywords = [(keyword, category) for keyword, category in self.keywords_sql if " " not in keyword]
         # Key phrases consisting of multiple words.
         self.phrase_keywords = [(keyword, category) for keyword, category in self.keywords_sql if " " in keyword]
 
-    def _classify_text(self, text):
-        """Decides the main category of a text based on keyword hits."""
-
-        # # # KEYWORD PHRASES HITS (multiple word key phrases)
-
-        category_hits = defaultdict(int)
-        for phrase, category in self.phrase_keywords:
-            category_hits[category] += len(re.findall(phrase, text))
-
-        # # # SINGLE KEYWORDS HITS
+    def _phrase_hits(self) -> dict:
+        """{(article id, phrase): hits} of the key phrases, counted on whole words by the full text index."""
 
-        # Get a word count of unique words in all articles.
-        article_words = text.split()
-        for keyword, category in self.single_keywords:
-            category_hits[category] += article_words.count(keyword)
-
-        # Determine the most common category among keyword hits
-        category, count = list(category_hits.keys()), list(category_hits.values())
-        main_category = [category[count.index(max(count))]][0]
-
-        # Return the category with the most hits.
-        return main_category
+        hits = {}
+        for phrase, _ in self.phrase_keywords:
+            for article_id, count in self.full_text.phrase_hits(phrase, self.exclude_duplicates).items():
+                hits[article_id, phrase] = count
+        return hits
 
     def top_keywords(self) -> pd.DataFrame:
         """Count keyword hits in all articles, using different methods for single word keywords and multiple word phrases, for better speed."""
 
-        # # # KEYWORD PHRASES HITS (multiple word key phrases)
-
-        # Counting phrase hits for rows with "phrase_hit" == True
-        phrases_hit_count = defaultdict(int)
-        for article in self.df_articles["text"]:
-            for phrase, _ in self.phrase_keywords:
-                phrases_hit_count[phrase] += len(re.findall(phrase, article))
+        has_articles = bool(sql.execute_query(self.db, "SELECT 1 FROM articles LIMIT 1;"))
+        phrases_hit_count = {phrase: 0 for phrase, _ in self.phrase_keywords} if has_articles else {}
+
+        if self.exclude_duplicates:
+            # Read from the daily rollup of the current filters, a few rows per day.
+            self.labels.refresh()
+            totals = self.labels.rollups.keyword_totals()
+            for phrase in phrases_hit_count:
+                phrases_hit_count[phrase] = totals.get(phrase, 0)
+            df_singles_result = pd.DataFrame(sorted((keyword, category, totals[keyword])
+                                                    for keyword, category in self.keywords_sql
+                                                    if " " not in keyword and totals.get(keyword)),
+                                             columns=["keyword", "category", "count"])
+        else:
+            # # # KEYWORD PHRASES HITS (multiple word key phrases)
+            for (_, phrase), count in self._phrase_hits().items():
+                phrases_hit_count[phrase] += count
+
+            # # # SINGLE KEYWORD HITS (single word keywords), summed in SQL.
+            df_singles_result = pd.DataFrame(sql.execute_query(self.db, f"""
+                                    SELECT k.keyword, c.category, SUM(p.count) FROM keywords k
+                                    JOIN categories c ON c.id = k.category_id
+                                    CROSS JOIN terms t ON t.term = k.keyword
+                                    CROSS JOIN postings p ON p.term_id = t.id
+                                    CROSS JOIN articles a ON a.rowid = p.article_id
+                                    WHERE 1 {self.originals_only}
+                                    GROUP BY k.keyword;"""), columns=["keyword", "category", "count"])
         df_phrases_hits = pd.DataFrame(
             phrases_hit_count.items(), columns=["phrase", "count"])
 
-        # # # SINGLE KEYWORD HITS (single word keywords)
-
-        # Get a word count of unique words in all articles.
-        words_count = defaultdict(int)
-        for word in self.articles_words_list:
-            words_count[word] += 1
-        df_all_articles_words_count = pd.DataFrame(words_count.items(), columns=["word", "count"])
-
         # # # Finalize data
 
         # Dataframe from keywords/categories table in sql database
         df_keywords = pd.DataFrame(self.keywords_sql, columns=["keyword", "category"])
-        # By merging keywords table with article words counts, we get a DF with single keyword hit counts
-        df_singles_result = df_keywords.merge(df_all_articles_words_count, left_on="keyword", right_on="word")
-        del df_singles_result["word"]
         # By merging keywords table with phrases hit counts, we get a DF of all phrases hit counts.
         df_phrases_result = df_keywords.merge(df_phrases_hits, left_on="keyword", right_on="phrase")
         del df_phrases_result["phrase"]
@@ -94,21 +86,22 @@ class Statistics:
         # Sort dataframe by count
         return df_output
 
-    def top_categories(self):
-        """Counts articles per category and groups by date."""
-
-        categorized_articles = defaultdict(int)
-        for article in self.df_articles["text"]:
-
-            # Run _classify_text on the article, getting the most prominent category for the article..
-            main_category = self._classify_text(article)
+    def _label_counts(self, by_date: bool = False) -> pd.DataFrame:
+        """Articles per main category, and per date if asked, from the labels of the current filters."""
 
-            categorized_articles[main_category] += 1
+        version = self.labels.refresh()
+        date = "a.scrape_date, " if by_date else ""
+        return pd.DataFrame(sql.execute_query(self.db, f"""
+                                              SELECT {date}l.category, COUNT(*) FROM article_labels l
+                                              JOIN articles a ON a.rowid = l.article_id
+                                              WHERE l.version = ? {self.originals_only}
+                                              GROUP BY {date}l.category;""", (version,)),
+                            columns=(["date"] if by_date else []) + ["category", "count"])
 
-        # # # Finalize data
+    def top_categories(self):
+        """Counts articles per category."""
 
-        # Create a dataframe
-        df_output = pd.DataFrame(categorized_articles.items(), columns=["category", "count"])
+        df_output = self._label_counts()
         # Sort dataframe bycount
         df_output = df_output.sort_values(by="count", ascending=False)
 
@@ -117,13 +110,14 @@ class Statistics:
     def cateogories_by_date(self):
         """Isolate top 3 article category count per day (scrape-date)"""
 
-        # Make a working copy of the articles dataframe, leaving out the url column.
-        df_articles = self.df_articles[["date", "text"]]
-
-        # Run the text classfier on each article and add the main category to the new "label" column.
-        df_articles["label"] = df_articles["text"].apply(self._classify_text)
-        df_grouped_by = df_articles.groupby(['date', 'label']).size().reset_index(name='count')
+        if self.exclude_duplicates:
+            # Read from the daily rollup, a few rows per day.
+            version = self.labels.refresh()
+            return pd.DataFrame(self.labels.rollups.top_categories_by_date(version, per_day=3),
+                                columns=["date", "label", "count"])
 
+        # Article count per date and main category.
+        df_grouped_by = self._label_counts(by_date=True).rename(columns={"category": "label"})
         # Pivot the table and put labels (categories) as columns. 
         pivoted = df_grouped_by.pivot(index='date', columns='label', values='count')
 
@@ -0,0 +1,122 @@
+"""Scrapes the news sites without the curses interface, for cron, systemd or any terminal of any size.
+
+    python headless.py --once
+    python headless.py --interval 3600
+
+Logs one JSON object per line. Exit codes: 0 success, 1 a run crashed, 3 every scrape of a --once run failed.
+"""
+import sys
+import json
+import signal
+import logging
+import argparse
+import threading
+from time import perf_counter
+
+from newsbot_core import NewsBotCore
+from near_duplicates import POLICIES
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_ALL_FAILED = 3
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a log record as a single line of JSON, with any fields passed in extra={"fields": {...}}."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def run_once(bot: NewsBotCore) -> dict:
+    """One scrape of all sites, storing the results. Returns the run's counters."""
+
+    started = perf_counter()
+    outcomes = {"stored": 0, "duplicate": 0, "failed": 0}
+    results = bot.scrape()
+    try:
+        for result in results:
+            outcome = bot.process_result(result)
+            outcomes[outcome] += 1
+            if outcome == "failed":
+                logging.debug("scrape failed", extra={"fields": {"url": result.url, "error": str(result.error)}})
+    finally:
+        results.close()
+        bot.flush()
+
+    return {
+        **outcomes,
+        "seconds": round(perf_counter() - started, 1),
+        "articles_per_second": round(bot.scrape_engine.throughput, 2),
+        "http": bot.scrape_engine.client.stats(),
+        "latency": bot.scrape_engine.client.latencies.percentiles(),
+        "utilisation": {stage: round(share, 2) for stage, share in bot.scrape_engine.utilisation().items()},
+    }
+
+
+def main(argv: list = None) -> int:
+
+    parser = argparse.ArgumentParser(description="Scrape the news sites without the curses interface.")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--once", action="store_true", help="Scrape once and exit.")
+    mode.add_argument("--interval", type=float, metavar="SECONDS", help="Scrape again every SECONDS, until stopped.")
+    parser.add_argument("--database", default="data.db")
+    parser.add_argument("--workers", type=int, default=8, help="Articles fetched at the same time.")
+    parser.add_argument("--per-domain", type=int, default=2, help="Articles fetched at the same time per site.")
+    parser.add_argument("--parse-workers", type=int, default=None,
+                        help="Processes extracting and cleaning article text, default one per core but one.")
+    parser.add_argument("--duplicates", choices=POLICIES, default="flag",
+                        help="Near duplicates of stored articles: skip them, store them flagged, "
+                             "or store only a link to the original.")
+    parser.add_argument("--hedge-after", type=float, default=None, metavar="SECONDS",
+                        help="Send a request again when it has not answered after SECONDS.")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args(argv)
+
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter())
+    logging.basicConfig(level=args.log_level.upper(), handlers=[handler])
+
+    bot = NewsBotCore(args.database, max_workers=args.workers, per_domain=args.per_domain,
+                      parse_workers=args.parse_workers, duplicate_policy=args.duplicates,
+                      hedge_after=args.hedge_after)
+
+    # SIGTERM and Ctrl-C stop the current run at the next article and end the loop.
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        logging.info("stopping", extra={"fields": {"signal": signal.Signals(signum).name}})
+        stopping.set()
+        bot.scrape_engine.cancel()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping.is_set():
+        try:
+            counters = run_once(bot)
+        except Exception:
+            logging.exception("scrape run crashed")
+            if args.once:
+                return EXIT_ERROR
+        else:
+            logging.info("scrape run finished", extra={"fields": counters})
+            if args.once:
+                return EXIT_ALL_FAILED if counters["failed"] and not (counters["stored"] or counters["duplicate"]) else EXIT_OK
+
+        stopping.wait(args.interval)
+
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+import os
+import zlib
+import hashlib
+import tempfile
+from datetime import datetime
+
+import sql_manager as sql
+
+
+class HtmlArchive:
+    """Compressed, content-addressed store of fetched article HTML, so articles can be re-extracted without the network.
+       Pages are zlib compressed into files named by their sha256, the html_archive table maps urls to them."""
+
+    def __init__(self, database: dict, directory: str = "html_archive") -> None:
+
+        self.db = database
+        self.directory = directory
+        sql.execute_query(self.db, """
+                          CREATE TABLE IF NOT EXISTS html_archive(
+                          url TEXT PRIMARY KEY, content_hash TEXT, archive_date DATETIME);""")
+
+    @staticmethod
+    def blob_path(directory: str, content_hash: str) -> str:
+        # Spread the files over 256 sub directories.
+        return os.path.join(directory, content_hash[:2], content_hash + ".zz")
+
+    @staticmethod
+    def read_blob(directory: str, content_hash: str) -> str:
+        """Returns the decompressed HTML of an archived page."""
+        with open(HtmlArchive.blob_path(directory, content_hash), "rb") as f:
+            return zlib.decompress(f.read()).decode("utf-8")
+
+    def store(self, url: str, html: str) -> str:
+        """Archives the HTML of a url and returns its content hash. Identical pages are only stored once."""
+
+        data = html.encode("utf-8")
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(self.directory, content_hash)
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file of its own first, so a crash never leaves a half written blob behind,
+            # nor can two threads archiving the same page write to the same file.
+            fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(zlib.compress(data, 6))
+                os.replace(temp_path, path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+
+        sql.execute_query(self.db, """
+                          INSERT OR REPLACE INTO html_archive (url, content_hash, archive_date)
+                          VALUES (?, ?, ?);""", (url, content_hash, str(datetime.now().date())))
+        return content_hash
+
+    def load(self, url: str) -> str:
+        """Returns the archived HTML of a url, or None if it was never archived."""
+        rows = sql.execute_query(self.db, "SELECT content_hash FROM html_archive WHERE url = ?;", (url,))
+        if not rows:
+            return None
+        return self.read_blob(self.directory, rows[0][0])
@@ -0,0 +1,372 @@
+import re
+import socket
+import logging
+import threading
+import requests
+from time import perf_counter
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+
+from rate_limiter import DomainRateLimiter, parse_retry_after
+from http_fixtures import FixtureArchive, RecordingAdapter, ReplayAdapter
+from latency_histogram import DomainLatencies
+
+
+def url_domain(url: str) -> str:
+    """Returns the host part of a url, without any leading "www."."""
+    return re.sub(r"^www\.", "", urlparse(url).netloc.lower())
+
+
+class HttpStatusError(Exception):
+    """A page answered with something other than 200 OK, after any retries."""
+
+    def __init__(self, status_code: int, url: str) -> None:
+        super().__init__(f"{status_code} {url}")
+        self.status_code = status_code
+        self.url = url
+
+
+class DeadlineExceeded(requests.Timeout):
+    """A request, with its retries, did not complete within its total deadline."""
+
+
+class BodyTooLarge(requests.RequestException):
+    """A response body was larger than the client accepts."""
+
+
+def _abort(response: requests.Response) -> None:
+    """Closes a response from another thread. The socket is shut down first, waking any read blocked on it."""
+    sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+
+class _Race:
+    """The two requests of a hedged get. The first to succeed wins, the other is closed, or aborted if the first
+       request is still downloading when the hedge wins."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # Set once the first request returned or failed, so a hedge not yet sent is never sent.
+        self.first_done = threading.Event()
+        # "first" or "hedge".
+        self.winner = None
+        # Response of the first request, once its headers are in.
+        self.response = None
+
+    def first_response(self, response: requests.Response) -> None:
+        """Called by the first request as its headers come in, aborting it if the hedge won already."""
+        with self.lock:
+            self.response = response
+            if self.winner == "hedge":
+                _abort(response)
+
+    def lost_first(self) -> bool:
+        return self.winner == "hedge"
+
+
+class HttpClient:
+    """Pooled HTTP client shared by the url scraper and the article scraper.
+       Keeps connections to each host open between requests, instead of a new TCP+TLS handshake per page."""
+
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:98.0) Gecko/20100101 Firefox/98.0",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,/;q=0.8",
+        "Accept-Language": "en-US,en;q=0.5",
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+        "Upgrade-Insecure-Requests": "1",
+        "Sec-Fetch-Dest": "document",
+        "Sec-Fetch-Mode": "navigate",
+        "Sec-Fetch-Site": "none",
+        "Sec-Fetch-User": "?1",
+        "Cache-Control": "max-age=0",
+    }
+
+    # Responses worth trying again once the domain's backoff is over.
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    # Bodies are read in pieces of this size, checking the size cap and the deadline in between.
+    chunk_size = 64 * 1024
+
+    def __init__(self, pool_maxsize: int = 2, pool_hosts: int = 32,
+                 limiter: DomainRateLimiter = None, max_retries: int = 2,
+                 fixture_mode: str = None, fixture_path: str = "fixtures.db", replay_latency: float = 0.0,
+                 timeout: tuple = (5.0, 15.0), deadline: float = 45.0, max_body: int = 8_000_000,
+                 hedge_after: float = None, hedge_workers: int = 8) -> None:
+        """pool_maxsize: open connections kept per host, should match the scrape engine's per-domain cap.
+           pool_hosts: number of host pools kept, above the number of hosts scraped so none get evicted.
+           limiter: per-domain rate limiter every request waits for.
+           max_retries: extra attempts after a 429 or 5xx response.
+           fixture_mode: "record" saves every response to the fixture file at fixture_path,
+           "replay" serves all requests from it instead of the network, each delayed by replay_latency seconds.
+           timeout: (connect, read) seconds, the read timeout being the longest wait for any data.
+           deadline: total seconds for a get() including retries and the body download, None for no limit.
+           max_body: largest body in bytes accepted, bigger ones raise BodyTooLarge.
+           hedge_after: when set, a request without a response after this many seconds is sent again,
+           and whichever answers first is used. Trims the slow tail at the cost of some extra requests.
+           hedge_workers: threads sending the second requests, one per thread calling get() at once,
+           e.g. the scrape engine's max_workers plus its discovery thread."""
+
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+
+        if fixture_mode == "record":
+            self.adapter = RecordingAdapter(FixtureArchive(fixture_path),
+                                            pool_connections=pool_hosts, pool_maxsize=pool_maxsize)
+        elif fixture_mode == "replay":
+            self.adapter = ReplayAdapter(FixtureArchive(fixture_path), replay_latency)
+        else:
+            self.adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+        self.limiter = limiter or DomainRateLimiter()
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_body = max_body
+        self.hedge_after = hedge_after
+        self._hedge_pool = (ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="hedge")
+                            if hedge_after else None)
+
+        self._lock = threading.Lock()
+        self.requests_count = 0
+        self.bytes_received = 0
+        self.hedged = 0
+        self.latencies = DomainLatencies()
+
+    def get(self, url: str, deadline: float = None, **kwargs) -> requests.Response:
+        """Same as requests.get, through the shared connection pool and the domain's rate limit.
+           429 and 5xx responses are retried after the backoff, the last response is returned either way.
+           deadline: total seconds for this call, instead of the client's. Raises DeadlineExceeded when out of time.
+           The body is downloaded before returning, unless stream=True is given."""
+
+        domain = url_domain(url)
+        deadline = self.deadline if deadline is None else deadline
+        deadline_at = perf_counter() + deadline if deadline else None
+
+        response = None
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(domain)
+            if deadline_at and perf_counter() >= deadline_at:
+                # Out of time waiting for the domain, keep the last answer if there was one.
+                if response is not None:
+                    break
+                raise DeadlineExceeded(f"No response from {url} within {deadline}s")
+            try:
+                if self._hedge_pool:
+                    response = self._hedged_get(url, deadline_at, **kwargs)
+                else:
+                    response = self._get(url, deadline_at, **kwargs)
+            except BodyTooLarge:
+                # Not the server's fault, no reason to slow down the domain.
+                raise
+            except requests.RequestException:
+                self.limiter.feedback(domain)
+                raise
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            self.limiter.feedback(domain, response.status_code, retry_after)
+            if response.status_code not in self.retry_statuses:
+                break
+            logging.warning(f"{response.status_code} {url}, attempt {attempt + 1} of {self.max_retries + 1}")
+        return response
+
+    def _hedged_get(self, url: str, deadline_at: float, **kwargs) -> requests.Response:
+        """_get on the caller's thread, sent a second time from the hedge pool when it has not answered within
+           hedge_after seconds of being sent. Returns the first successful response."""
+
+        race = _Race()
+        hedge = self._hedge_pool.submit(self._hedge, race, perf_counter(), url, deadline_at, **kwargs)
+        response = error = None
+        try:
+            response = self._get(url, deadline_at, race=race, **kwargs)
+        except Exception as e:
+            error = e
+        with race.lock:
+            if race.winner is None and response is not None:
+                race.winner = "first"
+            race.first_done.set()
+        if race.winner == "first":
+            return response
+
+        # The first request failed, or lost to the hedge: the hedge's answer, if it was sent.
+        if response is not None:
+            response.close()
+        hedged = hedge.result()
+        if hedged is None:
+            raise error
+        return hedged
+
+    def _hedge(self, race: _Race, sent: float, url: str, deadline_at: float, **kwargs) -> requests.Response:
+        """Hedge pool job: sends the request again once the first has run hedge_after seconds without answering.
+           Returns the response if it won the race, otherwise None."""
+
+        if race.first_done.wait(max(sent + self.hedge_after - perf_counter(), 0)):
+            return None
+        # The second request waits for the domain's rate limit like any other, unless the first answers meanwhile.
+        self.limiter.acquire(url_domain(url))
+        if race.first_done.is_set():
+            return None
+        with self._lock:
+            self.hedged += 1
+
+        response = self._get(url, deadline_at, **kwargs)
+        with race.lock:
+            if race.winner is None:
+                race.winner = "hedge"
+                if race.response is not None:
+                    _abort(race.response)
+                return response
+        response.close()
+        return None
+
+    def _get(self, url: str, deadline_at: float = None, stream: bool = False, race: _Race = None,
+             **kwargs) -> requests.Response:
+        """A single request, counted in the transfer statistics and the domain's latency histogram.
+           The body is read in chunks, within the size cap and the deadline.
+           race: of a hedged get, when this is its first request, which the hedge can win."""
+
+        started = perf_counter()
+        timeout = kwargs.pop("timeout", self.timeout)
+        connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        if deadline_at:
+            remaining = deadline_at - started
+            if remaining <= 0:
+                raise DeadlineExceeded(f"No time left for {url}")
+            connect_timeout, read_timeout = min(connect_timeout, remaining), min(read_timeout, remaining)
+
+        response = self.session.get(url, stream=True, timeout=(connect_timeout, read_timeout), **kwargs)
+        if race:
+            race.first_response(response)
+
+        length = int(response.headers.get("Content-Length") or 0)
+        if self.max_body and length > self.max_body:
+            response.close()
+            raise BodyTooLarge(f"{url} is {length} bytes, more than {self.max_body}")
+
+        if stream:
+            # The body is still to be read by the caller, and counted as it is.
+            self._guard_stream(response, url, deadline_at)
+            size = 0
+        else:
+            chunks = []
+            received = 0
+            # A server trickling data never trips the read timeout, the connection is closed at the deadline instead.
+            watchdog = threading.Timer(deadline_at - perf_counter(), _abort, (response,)) if deadline_at else None
+            if watchdog:
+                watchdog.daemon = True
+                watchdog.start()
+            try:
+                for chunk in response.iter_content(self.chunk_size):
+                    received += len(chunk)
+                    if self.max_body and received > self.max_body:
+                        response.close()
+                        raise BodyTooLarge(f"{url} is more than {self.max_body} bytes")
+                    chunks.append(chunk)
+            except BodyTooLarge:
+                raise
+            except Exception:
+                if deadline_at and perf_counter() >= deadline_at:
+                    # The slowest requests belong in the histogram too.
+                    self.latencies.record(url_domain(url), perf_counter() - started)
+                    raise DeadlineExceeded(f"{url} not downloaded within its deadline")
+                raise
+            finally:
+                if watchdog:
+                    watchdog.cancel()
+            if deadline_at and perf_counter() >= deadline_at:
+                raise DeadlineExceeded(f"{url} not downloaded within its deadline")
+            if race and race.lost_first():
+                # Aborted, what was read so far may look like a whole body.
+                raise requests.ConnectionError(f"{url} was answered by its hedge first")
+            response._content = b"".join(chunks)
+            response._content_consumed = True
+
+            # Bytes as they came over the wire (before gzip decoding), when urllib3 can tell.
+            try:
+                size = response.raw.tell() or received
+            except (AttributeError, TypeError):
+                size = received
+
+        self.latencies.record(url_domain(url), perf_counter() - started)
+        with self._lock:
+            self.requests_count += 1
+            self.bytes_received += size
+        return response
+
+    def _guard_stream(self, response: requests.Response, url: str, deadline_at: float) -> None:
+        """Keeps the caller's reading of a streamed body within the size cap and the deadline,
+           by wrapping the response's iter_content. The connection is closed at the deadline as in _get."""
+
+        iter_content = response.iter_content
+        close = response.close
+        watchdog = threading.Timer(deadline_at - perf_counter(), _abort, (response,)) if deadline_at else None
+        if watchdog:
+            watchdog.daemon = True
+            watchdog.start()
+
+        def guarded_iter_content(chunk_size: int = 1, decode_unicode: bool = False):
+            received = 0
+            try:
+                for chunk in iter_content(chunk_size, decode_unicode):
+                    received += len(chunk)
+                    with self._lock:
+                        self.bytes_received += len(chunk)
+                    if self.max_body and received > self.max_body:
+                        response.close()
+                        raise BodyTooLarge(f"{url} is more than {self.max_body} bytes")
+                    yield chunk
+                # A connection closed by the watchdog may just look like the end of the body.
+                if deadline_at and perf_counter() >= deadline_at:
+                    raise DeadlineExceeded(f"{url} not downloaded within its deadline")
+            except (BodyTooLarge, DeadlineExceeded):
+                raise
+            except Exception:
+                if deadline_at and perf_counter() >= deadline_at:
+                    raise DeadlineExceeded(f"{url} not downloaded within its deadline")
+                raise
+            finally:
+                if watchdog:
+                    watchdog.cancel()
+
+        def guarded_close() -> None:
+            if watchdog:
+                watchdog.cancel()
+            close()
+
+        response.iter_content = guarded_iter_content
+        response.close = guarded_close
+
+    def stats(self) -> dict:
+        """Connection reuse statistics, summed over all host pools."""
+
+        # A replaying client has no connection pools.
+        pools = self.adapter.poolmanager.pools if hasattr(self.adapter, "poolmanager") else {}
+        host_pools = [pools[key] for key in pools.keys()]
+        new_connections = sum(pool.num_connections for pool in host_pools)
+        pool_requests = sum(pool.num_requests for pool in host_pools)
+
+        return {
+            "requests": self.requests_count,
+            "new_connections": new_connections,
+            "reused_connections": max(pool_requests - new_connections, 0),
+            "bytes_received": self.bytes_received,
+            "hedged": self.hedged,
+        }
+
+    def summary(self) -> str:
+        stats = self.stats()
+        return (f"HTTP: {stats['requests']} requests, {stats['new_connections']} new connections, "
+                f"{stats['reused_connections']} reused, {stats['bytes_received'] / 1_000_000:.1f} MB received, "
+                f"{stats['hedged']} hedged")
+
+
+# Shared by default between all scrapers of the process.
+shared_client = HttpClient()
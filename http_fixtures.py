@@ -0,0 +1,91 @@
+import json
+import sqlite3
+import threading
+from time import sleep
+
+from requests import Response
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.utils import get_encoding_from_headers
+from requests.structures import CaseInsensitiveDict
+
+
+class FixtureArchive:
+    """Single SQLite file holding recorded HTTP exchanges: url, status, headers and body."""
+
+    def __init__(self, path: str) -> None:
+
+        self.path = path
+        # Shared by the scraper threads, writes are serialized by the lock.
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+                                CREATE TABLE IF NOT EXISTS responses(
+                                url TEXT PRIMARY KEY, status INTEGER, headers TEXT, body BLOB);""")
+        self._lock = threading.Lock()
+
+    def save(self, url: str, status: int, headers: dict, body: bytes) -> None:
+        with self._lock:
+            self.connection.execute("INSERT OR REPLACE INTO responses (url, status, headers, body) VALUES (?, ?, ?, ?);",
+                                    (url, status, json.dumps(dict(headers)), body))
+            self.connection.commit()
+
+    def load(self, url: str) -> tuple:
+        """Returns (status, headers, body) of a recorded url, or None."""
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT status, headers, body FROM responses WHERE url = ?;", (url,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM responses;").fetchone()[0]
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Transport adapter that makes real requests and saves every response to a fixture archive."""
+
+    def __init__(self, archive: FixtureArchive, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.archive = archive
+
+    def send(self, request, **kwargs) -> Response:
+        response = super().send(request, **kwargs)
+        # Reading the body here also releases the connection back to the pool.
+        body = response.content
+        # The body is saved decoded, so the encoding headers no longer apply to it.
+        headers = {key: value for key, value in response.headers.items()
+                   if key.lower() not in ("content-encoding", "transfer-encoding", "content-length")}
+        self.archive.save(request.url, response.status_code, headers, body)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """Transport adapter that answers requests from a fixture archive, without any network.
+       latency adds a fixed delay per request, to mimic a real server. Unrecorded urls get a 404."""
+
+    def __init__(self, archive: FixtureArchive, latency: float = 0.0) -> None:
+        super().__init__()
+        self.archive = archive
+        self.latency = latency
+
+    def send(self, request, **kwargs) -> Response:
+        if self.latency:
+            sleep(self.latency)
+
+        recorded = self.archive.load(request.url)
+        status, headers, body = recorded if recorded else (404, {}, b"")
+
+        response = Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = body
+        response._content_consumed = True
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.reason = "Replayed"
+        return response
+
+    def close(self) -> None:
+        pass
@@ -1,6 +1,4 @@
 import curses
-import re
-from collections import defaultdict
 
 import sql_manager as sql
 from graph_plotter import CursedGraphs
@@ -26,34 +24,21 @@ class Info:
         
         self.display_info()
 
-    def display_info(self) -> None:
-        """Dispaly a breakdown of statistics from the database."""
+    def display_info(self, update: bool = True) -> None:
+        """Dispaly a breakdown of statistics from the database.
+        update=False leaves the screen update to a later curses.doupdate()."""
         
-        # Tables counts
-        article_count = len([row for row in sql.execute_query(
-            self.db, "SELECT url from articles")])
-        category_count = len([row for row in sql.execute_query(
-            self.db, "SELECT category from categories")])
-        keyword_count = len([row for row in sql.execute_query(
-            self.db, "SELECT keyword from keywords")])
+        # Tables counts, kept by triggers (see migrations) so this reads a few rows however many articles there are.
+        counts = dict(sql.execute_query(self.db, "SELECT name, rows FROM table_counts"))
 
         self.frame.addstr(3, 1, "Tables data".center(24), self.YELLOW)
         self.frame.attrset(self.CYAN)
-        self.frame.addstr(4, 2, f"Articles        :{article_count:5d}")
-        self.frame.addstr(5, 2, f"Categories      :{category_count:5d}")
-        self.frame.addstr(6, 2, f"Keywords        :{keyword_count:5d}")
+        self.frame.addstr(4, 2, f"Articles        :{counts.get('articles', 0):5d}")
+        self.frame.addstr(5, 2, f"Categories      :{counts.get('categories', 0):5d}")
+        self.frame.addstr(6, 2, f"Keywords        :{counts.get('keywords', 0):5d}")
         
-        # Articles by domain 
-        # Fetch urls from database
-        article_urls = sql.execute_query(self.db, "SELECT url FROM articles")
-        domains_data = defaultdict(int)
-        # Count occurence of each domain
-        for url in article_urls:
-            domain = re.sub(r"^https://(www.)?|/.*", "", url[0])
-            domains_data[domain] += 1
-        
-        #Put domain name and count in tuples in a list. Sort tuples by the count
-        tuples = sorted([(label, value) for label, value in domains_data.items()], key=lambda a: a[1], reverse=True)
+        # Articles by domain, top 10, also counted by triggers.
+        tuples = sql.execute_query(self.db, "SELECT domain, articles FROM domain_counts ORDER BY articles DESC LIMIT 10")
         
         # Display domain article counts.
         self.frame.addstr(8, 1, "Articles by domain".center(24), self.YELLOW)
@@ -63,8 +48,8 @@ class Info:
             self.frame.addstr(9 + i, 2, name)
             self.frame.addstr(9 + i, 18, ":")
             self.frame.addstr(9 + i, 19, f"{tup[1]:5d}")
-            # Only shows top 10 domains
-            if i == 9:
-                break
 
-        self.frame.refresh()
\ No newline at end of file
+        if update:
+            self.frame.refresh()
+        else:
+            self.frame.noutrefresh()
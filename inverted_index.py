@@ -0,0 +1,87 @@
+import argparse
+from collections import Counter
+
+import sql_manager as sql
+from migrations import migrate
+# Registers decode_content(), for reading the stored texts.
+import content_codec
+
+
+class InvertedIndex:
+    """Term counts of every stored article, built as the article is stored: a terms table with an id per
+       distinct word, and postings of (term_id, article_id, count) clustered by term.
+       Keyword hits become index lookups and SQL sums, instead of recounting every word of every article.
+       The tables are created by migration 9. article_id is the rowid of the article, VACUUM may renumber those,
+       rebuild() the index after one."""
+
+    # Articles per query when indexing an existing database.
+    backfill_batch = 500
+
+    def __init__(self, database: dict, writer: sql.BatchWriter = None) -> None:
+
+        self.db = database
+        # Optional, buffers postings to be written in batches, in order after their article.
+        self.writer = writer
+
+    @staticmethod
+    def _statements(url: str, words: str) -> list:
+        """(query, rows) that (re)index a stored article. Ids are looked up in SQL, so they work from a batch
+           written before the article's rowid is known."""
+
+        counts = Counter(words.split())
+        return [
+            ("DELETE FROM postings WHERE article_id = (SELECT rowid FROM articles WHERE url = ?);", [(url,)]),
+            ("INSERT OR IGNORE INTO terms (term) VALUES (?);", [(term,) for term in counts]),
+            ("""INSERT INTO postings (term_id, article_id, count)
+                SELECT terms.id, articles.rowid, ? FROM terms, articles WHERE terms.term = ? AND articles.url = ?;""",
+             [(count, term, url) for term, count in counts.items()]),
+        ]
+
+    def add(self, url: str, words: str) -> None:
+        """Indexes an article, stored or about to be by the same writer. Replaces its postings if it had any."""
+
+        if self.writer:
+            for query, rows in self._statements(url, words):
+                self.writer.add_many(query, rows)
+        else:
+            with sql.ConnectionManager(self.db) as cm:
+                for query, rows in self._statements(url, words):
+                    cm.cursor.executemany(query, rows)
+
+    def backfill(self) -> int:
+        """Indexes the stored articles that have no postings yet, a batch at a time. Returns how many."""
+
+        indexed = 0
+        last_rowid = 0
+        while True:
+            rows = sql.execute_query(self.db, """
+                                     SELECT rowid, url, decode_content(content) FROM articles
+                                     WHERE rowid > ? AND NOT EXISTS (SELECT 1 FROM postings WHERE article_id = articles.rowid)
+                                     ORDER BY rowid LIMIT ?;""", (last_rowid, self.backfill_batch))
+            if not rows:
+                return indexed
+            with sql.ConnectionManager(self.db) as cm:
+                for _, url, content in rows:
+                    if content:
+                        for query, params in self._statements(url, content):
+                            cm.cursor.executemany(query, params)
+                        indexed += 1
+            last_rowid = rows[-1][0]
+
+    def rebuild(self) -> int:
+        """Drops all postings and indexes every stored article again. Returns how many."""
+        sql.execute_query(self.db, "DELETE FROM postings;")
+        return self.backfill()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Index the stored articles that aren't yet.")
+    parser.add_argument("--database", default="data.db")
+    parser.add_argument("--rebuild", action="store_true", help="Index every article again, from scratch.")
+    args = parser.parse_args()
+
+    db = {"database": args.database}
+    migrate(db)
+    index = InvertedIndex(db)
+    print(f"Indexed {index.rebuild() if args.rebuild else index.backfill()} articles.")
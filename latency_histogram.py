@@ -0,0 +1,71 @@
+import math
+import threading
+from collections import defaultdict
+
+# Bucket upper bounds grow by this factor, from the first bucket's 10 ms up to about 2 minutes.
+BUCKET_GROWTH = 1.2
+FIRST_BUCKET = 0.01
+BUCKETS = 52
+
+
+class LatencyHistogram:
+    """Request latencies in fixed exponential buckets, so memory stays the same however many are recorded.
+       Percentiles are accurate to a bucket, i.e. within 20%."""
+
+    def __init__(self) -> None:
+        self.counts = [0] * (BUCKETS + 1)
+        self.total = 0
+        self.slowest = 0.0
+
+    @staticmethod
+    def bucket(seconds: float) -> int:
+        if seconds <= FIRST_BUCKET:
+            return 0
+        return min(math.ceil(math.log(seconds / FIRST_BUCKET, BUCKET_GROWTH)), BUCKETS)
+
+    @staticmethod
+    def upper_bound(bucket: int) -> float:
+        return FIRST_BUCKET * BUCKET_GROWTH ** bucket
+
+    def record(self, seconds: float) -> None:
+        self.counts[self.bucket(seconds)] += 1
+        self.total += 1
+        self.slowest = max(self.slowest, seconds)
+
+    def percentile(self, share: float) -> float:
+        """Upper bound of the bucket holding the given share (0 to 1) of the requests, capped at the slowest one."""
+        if not self.total:
+            return 0.0
+        rank = share * self.total
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.upper_bound(bucket), self.slowest)
+        return self.slowest
+
+
+class DomainLatencies:
+    """A latency histogram per domain, safe to record into from several threads."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.histograms = defaultdict(LatencyHistogram)
+
+    def record(self, domain: str, seconds: float) -> None:
+        with self._lock:
+            self.histograms[domain].record(seconds)
+
+    def percentiles(self) -> dict:
+        """{domain: {"count", "p50", "p95", "p99"}} with latencies in seconds."""
+        with self._lock:
+            return {domain: {"count": histogram.total,
+                             "p50": round(histogram.percentile(0.50), 3),
+                             "p95": round(histogram.percentile(0.95), 3),
+                             "p99": round(histogram.percentile(0.99), 3)}
+                    for domain, histogram in sorted(self.histograms.items())}
+
+    def summary(self) -> str:
+        return "Latency (p50/p95/p99): " + ", ".join(
+            f"{domain} {p['p50'] * 1000:.0f}/{p['p95'] * 1000:.0f}/{p['p99'] * 1000:.0f} ms ({p['count']})"
+            for domain, p in self.percentiles().items())
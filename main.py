@@ -1,87 +1,22 @@
-import sqlite3
 import logging
 import curses  # "pip install windows-curses" on windows systems.
-import pandas as pd
 import os
-from time import sleep
-from datetime import datetime
-from collections import defaultdict
+from time import perf_counter
 
-import sql_manager as sql
 from info import Info
 from menu import BotHead, Menu
 from header import Header
 from gui_assets import GuiAssets
-from url_scraper import UrlScraper
 from main_display import MainDisplay
-from text_cleaner import TextCleaner
-from article_scraper import ArticleScraper
+from newsbot_core import NewsBotCore, ScrapeProgress
 from graph_calculations import Statistics
 
 
-class NewsBot2000:
+class NewsBot2000(NewsBotCore):
+    """The curses application, on top of the scraping and storage of NewsBotCore."""
 
     def __init__(self) -> None:
 
-        # This list of dicts is iterated over while scraping news sites.
-        # I contains the required specific arguments for both the url_scraper and the article_scraper to function with precision.
-        self.news_sites = [
-            {"urls": [
-             "huffpost.com", "huffpost.com/news/world-news"],
-             "regex_url_match": r"/entry/",
-             "url_blacklist": None,
-             "tag_regex": r"entry__content",
-             "tag_blacklist": [r"author-card", r"slidedown"]
-             },
-
-            {"urls": [
-                "apnews.com/hub/world-news",
-                "apnews.com"],
-             "regex_url_match": r"/article/",
-             "url_blacklist": [r"/article/photography-", r"/article/videos-"],
-             "tag_regex": r"Article|article-|Body",
-             "tag_blacklist": []
-             },
-
-            {"urls": [
-                "edition.cnn.com/world",
-                "edition.cnn.com/world/africa",
-                "edition.cnn.com/world/americas",
-                "edition.cnn.com/world/asia",
-                "edition.cnn.com/world/australia",
-                "edition.cnn.com/world/china",
-                "edition.cnn.com/world/europe",
-                "edition.cnn.com/world/india",
-                "edition.cnn.com/world/middle-east",
-                "edition.cnn.com/world/united-kingdom"],
-             "regex_url_match": r"/\d+/\d+/\d+/",
-             "url_blacklist": [r"/gallery/", r"/videos/"],
-             "tag_regex": r"article__content|pg-rail-tall__body|BasicArticle__main|pg-special-article__body",
-             "tag_blacklist": [r"footer_"]
-             },
-
-            {"urls": ["news.com.au/world", "news.com.au"],
-             "regex_url_match": r"/news-story/",
-             "url_blacklist": None,
-             "tag_regex": r"story-primary",
-             "tag_blacklist": []
-             },
-
-            {"urls": ["latimes.com/world-nation", "latimes.com",],
-             "regex_url_match": r"/story/",
-             "url_blacklist": None,
-             "tag_regex": r"rich-text-article-body-content",
-             "tag_blacklist": [r"promo"]
-             },
-
-            {"urls": ["aljazeera.com"],
-             "regex_url_match": r"/\d+/\d+/\d+/",
-             "url_blacklist": [r"/gallery/", r"/liveblog/", r"list-of-key-events", r"/program/"],
-             "tag_regex": r"wysiwyg",
-             "tag_blacklist": []
-             }
-        ]
-
         # Initialize screen
         self.stdcr = curses.initscr()
         curses.curs_set(False)
@@ -89,17 +24,12 @@ class NewsBot2000:
         curses.use_default_colors()
         curses.noecho()  # Disable printing to terminal
 
-        # Initiate the article scraper and text processor
-        self.article_scraper = ArticleScraper()
-        self.text_cleaner = TextCleaner()
-
-        # Database check. Creates new db if check fails.
-        self.db = {"database": "data.db"}
+        # Database, scrape engine and text processor.
+        super().__init__()
 
-        try:
-            sql.execute_query(self.db, "SELECT * FROM articles LIMIT 1;")
-        except sqlite3.OperationalError:
-            self.create_database(self.db)
+        # Background scrape thread, and the scraping view's redraw rate.
+        self.scrape_worker = None
+        self.frames_per_second = 15
 
         # Dict to be populated with categories and keywords when requried.
         self.categories = {}
@@ -128,169 +58,50 @@ class NewsBot2000:
         # Keeps track of user input
         self.input_text = ""
 
-    def create_database(self, database: str) -> None:
-
-        # Define news categories and keywords
-        default_categories = {
-            'Business': ['economy', 'finance', 'market', 'investment', 'mergers', 'acquisitions', 'trade', 'industry', 'companies', 'stocks', 'bonds', 'startup', 'inflation'],
-            'Sports': ['athlete', 'team', 'competition', 'tournament', 'match', 'medal', 'record', 'championship', 'coach', 'stadium', 'player', 'league'],
-            'Technology': ['software', 'hardware', 'ai', 'cybersecurity', 'cloud', 'mobile', 'internet', 'electronics', 'innovation', 'gadget', 'robotics', 'cryptocurrency'],
-            'Politics': ['government', 'election', 'president', 'congress', 'senate', 'house', 'policy', 'bill', 'law', 'diplomacy', 'foreign', 'nation'],
-            'Entertainment': ['film', 'music', 'television', 'theater', 'comedy', 'dance', 'fashion', 'beauty', 'arts', 'media', 'pop', 'culture'],
-            'Health': ['medicine', 'disease', 'vaccine', 'nutrition', 'fitness', 'wellness', 'therapy', 'rehabilitation', 'lifestyle', 'doctor', 'pharmaceuticals', 'surgery'],
-            'Science': ['biology', 'chemistry', 'astronomy', 'climate', 'environment', 'evolution', 'geology', 'oceanography', 'physics', 'research', 'invention', 'space'],
-            'World News': ['war', 'conflict', 'peace', 'terrorism', 'human rights', 'disaster', 'refugee', 'immigration', 'politics', 'geopolitics', 'diplomat', 'humanitarian', 'ukraine'],
-            'Crime': ['murder', 'theft', 'robbery', 'fraud', 'cybercrime', 'police', 'kidnapping', 'smuggling', 'counterfeiting', 'illegal', 'arrest', 'bribery'],
-            'Environment': ["climate change", "global warming", "greenhouse gases", "renewable energy", "carbon emissions", "sustainability", "climate crisis", "oil spill", "environmental protection", "biodiversity", "ice caps", "environmental justice"]
-        }
-
-        # Create tables.
-        for query in (
-            "CREATE TABLE articles(url TEXT PRIMARY KEY, scrape_date DATETIME, content TEXT)",
-            "CREATE TABLE categories(id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, category TEXT)",
-            "CREATE TABLE keywords(keyword TEXT PRIMARY KEY, category_id INT, FOREIGN KEY (category_id) REFERENCES categories(id));",
-            "CREATE TABLE failed_scrapes(url TEXT PRIMARY KEY, scrape_date DATETIME, error_message TEXT)"
-        ):
-            sql.execute_query(database, query)
-
-        # Insert categories (keys from the above dict)
-        for category, keywords_list in default_categories.items():
-            sql.execute_query(
-                database, f"""INSERT INTO categories (category) VALUES ("{category}");""")
-
-            # Get the serial id from the category table for use as foreign key for keywords.
-            category_id = sql.execute_query(
-                database, f"""SELECT id FROM categories WHERE category = "{category}" """)[0][0]
-            for keyword in keywords_list:
-                sql.execute_query(
-                    database, f"""INSERT INTO keywords (keyword, category_id) VALUES ("{keyword}", {category_id});""")
-
-    def fetch_filters_from_db(self):
-        """Fetches and matches keywords with categories."""
-        # Get categories andd assign as keys in a new dictionary
-        cats = sql.execute_query(self.db, "SELECT * FROM categories;")
-        categories = {item[1]: item[0] for item in cats}
-        # Get keywords and assign into lists of values for each category
-        for key in categories:
-            categories[key] = [keyword[0] for keyword in sql.execute_query(
-                self.db,
-                f"SELECT keyword FROM keywords WHERE category_id = {categories[key]};")]
-        return categories
-
-    def delete_filter_from_database(self, *, category: str = None, keyword: str = None) -> None:
-
-        if category:
-            # Delete the cateogry
-            sql.execute_query(
-                self.db, f"""DELETE FROM categories WHERE category = "{category}";""")
-        elif keyword:
-            # Delete the keyword
-            sql.execute_query(
-                self.db, f"""DELETE FROM keywords WHERE keyword = "{keyword}";""")
-
-    def export_urls(self):
-        """Saves all article urls to at txt file."""
-
-        article_urls = (url[0] for url in sql.execute_query(
-            self.db, "SELECT url FROM articles;"))
-        with open("urls.txt", "w") as f:
-            for url in article_urls:
-                f.write(url + "\n")
-
     def run_scraper(self) -> None:
-        """Fetch any new articles from the news sites."""
+        """Fetch any new articles from the news sites.
+        Scraping runs on a background thread, the screen is redrawn from its progress at a fixed frame rate."""
 
-        # Fetch all stored urls from the database.
-        stored_urls = defaultdict(None)
-        for url in [url[0] for url in sql.execute_query(self.db, "SELECT url FROM articles;")]:
-            stored_urls[url] = None
-        for url in [url[0] for url in sql.execute_query(self.db, "SELECT url FROM failed_scrapes;")]:
-            stored_urls[url] = None
+        # Let a cancelled scrape finish its in-flight requests before starting a new one.
+        if self.scrape_worker and self.scrape_worker.is_alive():
+            self.scrape_worker.join()
 
         # Initiate the scraping GUI assets.
         self.display.frame.attrset(self.YELLOW)
         self.gui_assets.draw_box(self.display.frame, 6, 24, 1, 53)
         self.display.frame.addstr(5, 54, "[q] to stop".center(22))
 
-        for news_site in self.news_sites:
-            for url in news_site["urls"]:
-                # Get a list of generators with article urls from each site url.
-                url_generator = UrlScraper().generator(
-                    site_url=url,
-                    regex_url_match=news_site["regex_url_match"],
-                    url_blacklist=news_site["url_blacklist"]
-                )
-
-                # Iterate over the generator's urls and check the url against the database. Scrape it if not already stored.
-                for article_url in url_generator:
-                    # Stars on either side of the progress bar
-
-                    self.display.scraping_message(
-                        line1="CHECKING", line2="URLS", line3=f"*{' ' * 20}*")
-                    self.display.progress_bar(0)
-                    self.bothead.update_clock()
-                    sleep(0.01)  # SLEEP
-
-                    # GUI update, show current url
-                    self.display.scraping_url(article_url)
-                    self.display.frame.refresh()
-                    stop = self.menu.frame.getch()
-                    if stop == -1:
-                        pass
-                    if stop == 113:
-                        self.display.clear_frame()
-                        return
-
-                    # Avoid scraping the same article twice.
-                    if article_url in stored_urls:
-                        continue
-
-                    self.display.scraping_message(
-                        line1="REQUESTING", line2="PAGE", line3=f"*{' ' * 20}*")
-                    self.display.progress_bar(7)
-                    self.bothead.update_clock()
-                    # sleep(randint(1, 1) // 50)  # SLEEP
-
-                    # Scrape the article text. Stores in failed_scrapes for later review if there was a problem.
-                    try:
-                        text = self.article_scraper.scrape_text(
-                            article_url, news_site["tag_regex"], news_site["tag_blacklist"])
-                    except Exception as e:
-                        sql.execute_query(self.db,
-                                          f"""INSERT INTO failed_scrapes (url, scrape_date, error_message)
-                                            VALUES ("{article_url}", "{str(datetime.now().date())}", "{e}");""")
-                        stored_urls[article_url] = None
-                        continue
-
-                    if not text:
-                        sql.execute_query(self.db,
-                                          f"""INSERT INTO failed_scrapes (url, scrape_date, error_message)
-                                            VALUES ("{article_url}", "{str(datetime.now().date())}", "No text found");""")
-                        continue
-
-                    self.display.scraping_message(
-                        line1="CLEANING", line2="TEXT", line3=f"*{' ' * 20}*")
-                    self.display.progress_bar(13)
-                    self.bothead.update_clock()
-                    sleep(0.03)  # SLEEP
-
-                    # Clean the text and turn into list of list of words
-                    list_of_words = self.text_cleaner.clean_text(text)
-                    # With some forced delay and gui progress display, store them in the database.
-
-                    self.display.scraping_message(
-                        line1="SAVING TO ", line2="DATABASE", line3=f"*{' ' * 20}*")
-                    self.display.progress_bar(21)
-                    self.bothead.update_clock()
-                    sleep(0.03)  # SLEEP
-
-                    sql.execute_query(self.db,
-                                      f"""INSERT INTO articles (url, scrape_date, content)
-                                            VALUES ("{article_url}", "{str(datetime.now().date())}", "{list_of_words}") """)
-                    stored_urls[article_url] = None
-                    self.info.display_info()
+        progress = ScrapeProgress()
+        self.scrape_worker = self.scrape_in_background(progress)
+
+        # getch waits up to one frame for a key, so it paces the loop and 'q' is handled at once.
+        self.menu.frame.timeout(1000 // self.frames_per_second)
+        stored = -1
+        info_drawn = 0.0
+        try:
+            while self.scrape_worker.is_alive():
+                if self.menu.frame.getch() == 113:
+                    self.scrape_engine.cancel()
+                    self.display.clear_frame()
+                    return
+
+                state = progress.snapshot()
+                self.display.draw_scrape_progress(state)
+                self.bothead.update_clock(update=False)
+                # The info panel queries the database, redraw it at most once a second and only after changes.
+                if state["stored"] != stored and perf_counter() - info_drawn >= 1:
+                    self.info.display_info(update=False)
+                    stored = state["stored"]
+                    info_drawn = perf_counter()
+                curses.doupdate()
+        finally:
+            self.menu.frame.nodelay(True)
 
         self.display.clear_frame()
+        self.info.display_info()
+        # Leave the throughput of the finished run on screen.
+        self.display.scraping_url(progress.snapshot()["summary"])
+        curses.doupdate()
 
     def back_to_main_menu(self) -> None:
         """Reset assets for main menu view"""
@@ -332,15 +143,10 @@ class NewsBot2000:
             if self.display.selector_position > len(self.categories):
 
                 # Store the new category in the database.
-                sql.execute_query(
-                    self.db, f"""INSERT INTO categories (category) VALUES ("{self.input_text.capitalize()}") """)
+                self.add_category(self.input_text.capitalize())
             else:
-                # Get the id for the category to be used as foreign key for the keyword.
-                cat_id = sql.execute_query(
-                    self.db, f"""SELECT id FROM categories WHERE category = "{list(self.categories.keys())[self.display.selector_position - 1]}" """)[0][0]
-                # Store the new keyword in the database, with foreign key referring to the category.
-                sql.execute_query(
-                    self.db, f"""INSERT INTO keywords (keyword, category_id) VALUES ("{self.input_text.lower()}", "{cat_id}") """)
+                # Store the new keyword under the selected category.
+                self.add_keyword(self.input_text.lower(), list(self.categories.keys())[self.display.selector_position - 1])
 
     def key_events_base(self):
         self.key = -1
@@ -600,6 +406,11 @@ class NewsBot2000:
         self.quit()
 
     def quit(self) -> None:
+        # Let a cancelled scrape store what it already has.
+        if self.scrape_worker and self.scrape_worker.is_alive():
+            self.scrape_engine.cancel()
+            self.scrape_worker.join()
+        self.flush()
         curses.endwin()
         print("\nThank you for using NEWS BOT 2000.\n")
         exit()
@@ -64,7 +64,9 @@ class MainDisplay:
         self.frame.attrset(self.CYAN)
 
         self.frame.addstr(4, 55, progress_bar[:stage])
-        self.frame.refresh()
+        self.frame.noutrefresh()
+
+    # The scraping view is drawn by the render loop, which calls curses.doupdate() once per frame.
 
     def scraping_message(self, *, line1: str = "", line2: str = "", line3: str = ""):
         """Text shown while scraping articles."""
@@ -72,12 +74,21 @@ class MainDisplay:
         self.frame.addstr(3, 54, line2.center(22))
         self.frame.addstr(4, 54, line3.center(22), self.YELLOW)
         self.frame.addstr(5, 54, "[q] to stop".center(22), self.YELLOW)
-        self.frame.refresh()
+        self.frame.noutrefresh()
 
     def scraping_url(self, url):
         """Displays the currently checked/scraped url."""
         self.frame.addstr(7, 1, url[:128].center(128), self.YELLOW)
-        self.frame.refresh()
+        self.frame.noutrefresh()
+
+    def draw_scrape_progress(self, state: dict) -> None:
+        """One frame of the scraping view, from a ScrapeProgress snapshot."""
+
+        line1, _, line2 = state["stage"].partition(" ")
+        self.scraping_message(line1=line1, line2=line2, line3=f"*{' ' * 20}*")
+        self.progress_bar(21 if state["finished"] else 13 if state["stored"] or state["duplicate"] or state["failed"] else 7)
+        self.scraping_url(state["url"])
+        self.frame.addstr(8, 1, f"{state['stored']} saved, {state['duplicate']} duplicates, {state['failed']} failed".center(128), self.CYAN)
 
     def start_filter_selection(self, categories: dict, filter_type: str = "category", action: str = "add"):
         """Prepare settings, states and other variables upon entering filter selection."""
@@ -30,8 +30,8 @@ class BotHead:
             self.frame.addstr(0 + i, 2, line)
         self.frame.refresh()
 
-    def update_clock(self) -> None:
-        """Write current time and date."""
+    def update_clock(self, update: bool = True) -> None:
+        """Write current time and date. update=False leaves the screen update to a later curses.doupdate()."""
         current_time = datetime.now()
         self.frame.attrset(self.CYAN)
         self.frame.addstr(4, 8, f"{current_time.time()}"[:8].center(10))
@@ -39,7 +39,10 @@ class BotHead:
             5, 8, f"{f'{current_time.ctime()}'[:3]} {current_time.strftime('%d')}".center(10))
         self.frame.addstr(6, 8, f"{current_time.strftime('%b %Y')}".center(10))
 
-        self.frame.refresh()
+        if update:
+            self.frame.refresh()
+        else:
+            self.frame.noutrefresh()
 
 
 class Menu:
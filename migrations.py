@@ -0,0 +1,235 @@
+"""Versioned schema of the NewsBot2000 database, upgraded in place on startup.
+
+    python -m migrations data.db
+
+migrates a database and prints the query plans of the hot queries.
+"""
+import sys
+import sqlite3
+from datetime import datetime
+
+import sql_manager as sql
+# Points the full text index at the article texts, decoded or not.
+import content_codec
+
+
+def _add_column(cursor: sqlite3.Cursor, table: str, column: str, definition: str) -> None:
+    """Adds a column unless it is there already, added by a version of NewsBot2000 from before migrations."""
+    if column not in [row[1] for row in cursor.execute(f"PRAGMA table_info({table});")]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+
+
+def _base_schema(cursor: sqlite3.Cursor) -> None:
+    for query in (
+        "CREATE TABLE IF NOT EXISTS articles(url TEXT PRIMARY KEY, scrape_date DATETIME, content TEXT);",
+        "CREATE TABLE IF NOT EXISTS categories(id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, category TEXT);",
+        "CREATE TABLE IF NOT EXISTS keywords(keyword TEXT PRIMARY KEY, category_id INT, "
+        "FOREIGN KEY (category_id) REFERENCES categories(id));",
+        "CREATE TABLE IF NOT EXISTS failed_scrapes(url TEXT PRIMARY KEY, scrape_date DATETIME, error_message TEXT);",
+    ):
+        cursor.execute(query)
+
+
+def _retry_columns(cursor: sqlite3.Cursor) -> None:
+    # Attempt count, time of next attempt and error class of RetryQueue.
+    _add_column(cursor, "failed_scrapes", "attempts", "INTEGER NOT NULL DEFAULT 1")
+    _add_column(cursor, "failed_scrapes", "next_attempt", "DATETIME")
+    _add_column(cursor, "failed_scrapes", "error_class", "TEXT NOT NULL DEFAULT 'permanent'")
+
+
+def _duplicate_column(cursor: sqlite3.Cursor) -> None:
+    # Url of the original of a near duplicate, see NearDuplicateIndex.
+    _add_column(cursor, "articles", "duplicate_of", "TEXT")
+
+
+def _hot_query_indexes(cursor: sqlite3.Cursor) -> None:
+    # Statistics by date, filters per category, and the retries due.
+    cursor.execute("CREATE INDEX IF NOT EXISTS articles_scrape_date ON articles(scrape_date);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS keywords_category_id ON keywords(category_id);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS failed_scrapes_due ON failed_scrapes(error_class, next_attempt);")
+
+
+def _full_text_index(cursor: sqlite3.Cursor) -> None:
+    # articles_fts indexes articles.content without a copy of it, the triggers keep it in step.
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5("
+                   "content, content='articles', content_rowid='rowid');")
+    # Every position of every term, for counting phrase hits.
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts_instances USING fts5vocab(articles_fts, instance);")
+    cursor.execute("""
+                   CREATE TRIGGER IF NOT EXISTS articles_fts_insert AFTER INSERT ON articles BEGIN
+                   INSERT INTO articles_fts (rowid, content) VALUES (new.rowid, new.content);
+                   END;""")
+    cursor.execute("""
+                   CREATE TRIGGER IF NOT EXISTS articles_fts_delete AFTER DELETE ON articles BEGIN
+                   INSERT INTO articles_fts (articles_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+                   END;""")
+    cursor.execute("""
+                   CREATE TRIGGER IF NOT EXISTS articles_fts_update AFTER UPDATE OF content ON articles BEGIN
+                   INSERT INTO articles_fts (articles_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+                   INSERT INTO articles_fts (rowid, content) VALUES (new.rowid, new.content);
+                   END;""")
+    # Indexes the articles already stored.
+    cursor.execute("INSERT INTO articles_fts (articles_fts) VALUES ('rebuild');")
+
+
+def _compressed_content(cursor: sqlite3.Cursor) -> None:
+    # Dictionaries of the compressed article texts, see content_codec.
+    cursor.execute("CREATE TABLE IF NOT EXISTS content_dictionaries("
+                   "id BLOB PRIMARY KEY, dictionary BLOB, created DATETIME);")
+    # The full text index reads the texts from the articles_text view, which decodes them once they are compressed.
+    for trigger in ("articles_fts_insert", "articles_fts_delete", "articles_fts_update"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+    cursor.execute("DROP TABLE IF EXISTS articles_fts_instances;")
+    cursor.execute("DROP TABLE IF EXISTS articles_fts;")
+    cursor.execute("CREATE VIRTUAL TABLE articles_fts USING fts5("
+                   "content, content='articles_text', content_rowid='id');")
+    cursor.execute("CREATE VIRTUAL TABLE articles_fts_instances USING fts5vocab(articles_fts, instance);")
+    content_codec.index_texts(cursor)
+    cursor.execute("INSERT INTO articles_fts (articles_fts) VALUES ('rebuild');")
+
+
+def _plain_text_triggers(cursor: sqlite3.Cursor) -> None:
+    # Databases upgraded to version 6 before it kept the plain triggers of uncompressed texts.
+    content_codec.index_texts(cursor)
+
+
+def _domain(url: str) -> str:
+    """SQL for the domain of a url column, as the info panel names it: without https:// and www., up to the path."""
+    host = (f"CASE WHEN substr({url}, 1, 8) != 'https://' THEN {url} "
+            f"WHEN substr({url}, 9, 3) = 'www' AND length({url}) > 11 THEN substr({url}, 13) "
+            f"ELSE substr({url}, 9) END")
+    return f"CASE WHEN instr({host}, '/') THEN substr({host}, 1, instr({host}, '/') - 1) ELSE {host} END"
+
+
+def _row_counters(cursor: sqlite3.Cursor) -> None:
+    # Rows per table and articles per domain for the info panel, counted by triggers instead of by table scans.
+    cursor.execute("CREATE TABLE IF NOT EXISTS table_counts(name TEXT PRIMARY KEY, rows INTEGER NOT NULL);")
+    cursor.execute("CREATE TABLE IF NOT EXISTS domain_counts(domain TEXT PRIMARY KEY, articles INTEGER NOT NULL);")
+    for table in ("articles", "categories", "keywords"):
+        cursor.execute(f"INSERT OR REPLACE INTO table_counts (name, rows) SELECT '{table}', COUNT(*) FROM {table};")
+        cursor.execute(f"""
+                       CREATE TRIGGER IF NOT EXISTS {table}_count_insert AFTER INSERT ON {table} BEGIN
+                       UPDATE table_counts SET rows = rows + 1 WHERE name = '{table}';
+                       END;""")
+        cursor.execute(f"""
+                       CREATE TRIGGER IF NOT EXISTS {table}_count_delete AFTER DELETE ON {table} BEGIN
+                       UPDATE table_counts SET rows = rows - 1 WHERE name = '{table}';
+                       END;""")
+
+    cursor.execute("DELETE FROM domain_counts;")
+    cursor.execute(f"INSERT INTO domain_counts (domain, articles) SELECT {_domain('url')}, COUNT(*) FROM articles GROUP BY 1;")
+    cursor.execute(f"""
+                   CREATE TRIGGER IF NOT EXISTS articles_domain_insert AFTER INSERT ON articles BEGIN
+                   INSERT INTO domain_counts (domain, articles) VALUES ({_domain('new.url')}, 1)
+                   ON CONFLICT DO UPDATE SET articles = articles + 1;
+                   END;""")
+    cursor.execute(f"""
+                   CREATE TRIGGER IF NOT EXISTS articles_domain_delete AFTER DELETE ON articles BEGIN
+                   UPDATE domain_counts SET articles = articles - 1 WHERE domain = {_domain('old.url')};
+                   DELETE FROM domain_counts WHERE domain = {_domain('old.url')} AND articles <= 0;
+                   END;""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS domain_counts_articles ON domain_counts(articles);")
+
+
+def _keyword_tables(cursor: sqlite3.Cursor) -> None:
+    # Term counts of the stored articles, see InvertedIndex. article_id is the rowid of the article.
+    cursor.execute("CREATE TABLE IF NOT EXISTS terms(id INTEGER PRIMARY KEY, term TEXT UNIQUE);")
+    cursor.execute("""
+                   CREATE TABLE IF NOT EXISTS postings(
+                   term_id INTEGER, article_id INTEGER, count INTEGER,
+                   PRIMARY KEY (term_id, article_id)) WITHOUT ROWID;""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS postings_article ON postings(article_id);")
+    # Main category of every article per filter version, see ArticleLabels.
+    cursor.execute("""
+                   CREATE TABLE IF NOT EXISTS article_labels(
+                   version TEXT, article_id INTEGER, category TEXT,
+                   PRIMARY KEY (version, article_id)) WITHOUT ROWID;""")
+    cursor.execute("""
+                   CREATE TABLE IF NOT EXISTS label_versions(
+                   version TEXT PRIMARY KEY, keywords TEXT, complete INTEGER NOT NULL DEFAULT 0);""")
+    # Per day counts of the original articles, see DailyRollups.
+    cursor.execute("""
+                   CREATE TABLE IF NOT EXISTS daily_keyword_counts(
+                   date DATETIME, keyword TEXT, count INTEGER,
+                   PRIMARY KEY (date, keyword)) WITHOUT ROWID;""")
+    cursor.execute("""
+                   CREATE TABLE IF NOT EXISTS daily_category_counts(
+                   version TEXT, date DATETIME, category TEXT, articles INTEGER,
+                   PRIMARY KEY (version, date, category)) WITHOUT ROWID;""")
+
+
+# (version, description, step), in order. Steps run in the same transaction as their version bump,
+# so a database is always at exactly one version. Never change a released step, add a new one.
+MIGRATIONS = (
+    (1, "Base tables", _base_schema),
+    (2, "Retry columns of failed_scrapes", _retry_columns),
+    (3, "Near duplicate mark of articles", _duplicate_column),
+    (4, "Indexes for the hot queries", _hot_query_indexes),
+    (5, "Full text index of articles", _full_text_index),
+    (6, "Compressed article texts", _compressed_content),
+    (7, "Row counts for the info panel", _row_counters),
+    (8, "Full text triggers without decode_content() while uncompressed", _plain_text_triggers),
+    (9, "Keyword index, article labels and daily counts", _keyword_tables),
+)
+
+# Queries run on every scrape or redraw, with the index each should be using.
+HOT_QUERIES = (
+    ("filters of a category", "SELECT keyword FROM keywords WHERE category_id = ?;", (1,), "keywords_category_id"),
+    ("articles of a day", "SELECT url FROM articles WHERE scrape_date = ?;", ("2023-02-21",), "articles_scrape_date"),
+    ("retries due", """SELECT url FROM failed_scrapes WHERE error_class = 'transient' AND next_attempt <= ?
+                       ORDER BY next_attempt LIMIT 500;""", ("2023-02-21 00:00:00",), "failed_scrapes_due"),
+    ("top domains", "SELECT domain, articles FROM domain_counts ORDER BY articles DESC LIMIT 10;", (),
+     "domain_counts_articles"),
+    ("postings of a keyword", """SELECT p.article_id FROM terms t JOIN postings p ON p.term_id = t.id
+                                 WHERE t.term = ?;""", ("climate",), "PRIMARY KEY"),
+    ("postings of an article", "DELETE FROM postings WHERE article_id = ?;", (1,), "postings_article"),
+    ("labels of a version", "SELECT COUNT(*) FROM article_labels WHERE version = ?;", ("0",), "PRIMARY KEY"),
+    ("daily category counts", "SELECT date, category, articles FROM daily_category_counts WHERE version = ?;",
+     ("0",), "PRIMARY KEY"),
+)
+
+
+def schema_version(database: dict) -> int:
+    sql.execute_query(database, """
+                      CREATE TABLE IF NOT EXISTS schema_version(
+                      version INTEGER PRIMARY KEY, description TEXT, applied DATETIME);""")
+    return sql.execute_query(database, "SELECT COALESCE(MAX(version), 0) FROM schema_version;")[0][0]
+
+
+def migrate(database: dict) -> list:
+    """Runs the migrations the database hasn't had yet, in order. Returns the versions applied."""
+
+    applied = []
+    current = schema_version(database)
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        with sql.ConnectionManager(database) as cm:
+            # Another process may have migrated while this one waited for the write lock.
+            if cm._execute("SELECT 1 FROM schema_version WHERE version = ?;", (version,)):
+                continue
+            step(cm.cursor)
+            cm._execute("INSERT INTO schema_version (version, description, applied) VALUES (?, ?, ?);",
+                        (version, description, datetime.now().isoformat(sep=" ", timespec="seconds")))
+        applied.append(version)
+    return applied
+
+
+def check_query_plans(database: dict) -> dict:
+    """Returns {query name: plan} of the hot queries, raising AssertionError if one doesn't use its index."""
+
+    plans = {}
+    for name, query, params, index in HOT_QUERIES:
+        plan = " / ".join(row[-1] for row in sql.execute_query(database, "EXPLAIN QUERY PLAN " + query, params))
+        if index not in plan:
+            raise AssertionError(f"{name} doesn't use {index}: {plan}")
+        plans[name] = plan
+    return plans
+
+
+if __name__ == "__main__":
+
+    db = {"database": sys.argv[1] if len(sys.argv) > 1 else "data.db"}
+    print(f"Applied migrations {migrate(db) or 'none'}, schema version {schema_version(db)}.")
+    for name, plan in check_query_plans(db).items():
+        print(f"{name}: {plan}")
@@ -0,0 +1,120 @@
+import hashlib
+from collections import deque
+
+import sql_manager as sql
+# Registers decode_content(), for reading the stored texts.
+import content_codec
+
+# What to do with an article that is a near duplicate of one already stored:
+# "skip" doesn't store it, "flag" stores it marked with the url of the original,
+# "link" stores only the mark, without the text.
+POLICIES = ("skip", "flag", "link")
+
+# The 64-bit fingerprint is split into this many bands for the candidate lookup.
+BANDS = 4
+BAND_BITS = 64 // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """64-bit SimHash of a cleaned text, over its overlapping word shingles.
+       Texts that share most of their shingles get fingerprints differing in only a few bits."""
+
+    words = text.split()
+    shingles = [" ".join(words[i:i + shingle_size]) for i in range(max(len(words) - shingle_size + 1, 1))]
+    hashes = [f"{int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'big'):064b}"
+              for shingle in shingles]
+
+    # Each bit of the fingerprint is set when most shingle hashes have it set, read column by column.
+    half = len(hashes) / 2
+    fingerprint = 0
+    for column in zip(*hashes):
+        fingerprint = (fingerprint << 1) | (column.count("1") > half)
+    return fingerprint
+
+
+def _signed(value: int) -> int:
+    """SQLite integers are signed 64-bit."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _bands(fingerprint: int) -> list:
+    return [(fingerprint >> (band * BAND_BITS)) & BAND_MASK for band in range(BANDS)]
+
+
+class NearDuplicateIndex:
+    """SimHash fingerprints of the stored articles, with an indexed column per 16-bit band.
+       Two fingerprints within max_distance <= 3 bits share at least one band exactly, so only the articles
+       sharing a band are compared: a handful of index lookups per check, whatever the size of the archive."""
+
+    # Rows per query when fingerprinting an existing database.
+    backfill_batch = 2000
+
+    def __init__(self, database: dict, max_distance: int = 3, writer: sql.BatchWriter = None) -> None:
+
+        self.db = database
+        self.max_distance = max_distance
+        # Optional, buffers new fingerprints to be written in batches.
+        # Those not yet written are kept here as (writer.flushes when added, url, fingerprint).
+        self.writer = writer
+        self.recent = deque()
+
+        sql.execute_query(self.db, f"""
+                          CREATE TABLE IF NOT EXISTS fingerprints(
+                          url TEXT PRIMARY KEY, simhash INTEGER,
+                          {", ".join(f"band{band} INTEGER" for band in range(BANDS))});""")
+        for band in range(BANDS):
+            sql.execute_query(self.db, f"CREATE INDEX IF NOT EXISTS fingerprints_band{band} ON fingerprints(band{band});")
+
+        if not sql.execute_query(self.db, "SELECT 1 FROM fingerprints LIMIT 1;"):
+            self.backfill()
+
+    def backfill(self) -> None:
+        """Fingerprints all stored original articles, a batch at a time."""
+
+        last_rowid = 0
+        while True:
+            rows = sql.execute_query(self.db, """
+                                     SELECT rowid, url, decode_content(content) FROM articles
+                                     WHERE rowid > ? AND duplicate_of IS NULL ORDER BY rowid LIMIT ?;""",
+                                     (last_rowid, self.backfill_batch))
+            if not rows:
+                break
+            sql.execute_many(self.db, self._insert_query(),
+                             [self._row(url, simhash(content)) for _, url, content in rows if content])
+            last_rowid = rows[-1][0]
+
+    @staticmethod
+    def _insert_query() -> str:
+        return (f"INSERT OR REPLACE INTO fingerprints (url, simhash, {', '.join(f'band{b}' for b in range(BANDS))}) "
+                f"VALUES ({', '.join('?' * (BANDS + 2))});")
+
+    @staticmethod
+    def _row(url: str, fingerprint: int) -> tuple:
+        return (url, _signed(fingerprint), *_bands(fingerprint))
+
+    def _near(self, fingerprint: int, candidate: int) -> bool:
+        return ((candidate % (1 << 64)) ^ fingerprint).bit_count() <= self.max_distance
+
+    def find(self, fingerprint: int) -> str:
+        """Returns the url of a stored article within max_distance bits of the fingerprint, or None."""
+
+        while self.recent and self.recent[0][0] + 2 <= self.writer.flushes:
+            self.recent.popleft()
+        for _, url, candidate in self.recent:
+            if self._near(fingerprint, candidate):
+                return url
+
+        where = " OR ".join(f"band{band} = ?" for band in range(BANDS))
+        for url, candidate in sql.execute_query(self.db, f"SELECT url, simhash FROM fingerprints WHERE {where};",
+                                                tuple(_bands(fingerprint))):
+            if self._near(fingerprint, candidate):
+                return url
+        return None
+
+    def add(self, url: str, fingerprint: int) -> None:
+        if self.writer:
+            self.recent.append((self.writer.flushes, url, fingerprint))
+            self.writer.add(self._insert_query(), self._row(url, fingerprint))
+        else:
+            sql.execute_query(self.db, self._insert_query(), self._row(url, fingerprint))
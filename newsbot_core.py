@@ -0,0 +1,246 @@
+import os
+import logging
+import threading
+from datetime import datetime
+
+import sql_manager as sql
+from migrations import migrate
+from content_codec import ContentCodec
+from text_cleaner import TextCleaner
+from site_profiles import load_profiles
+from http_client import HttpClient
+from page_cache import PageCache
+from feed_scraper import FeedState
+from html_archive import HtmlArchive
+from scrape_engine import ScrapeEngine, ScrapeResult
+from url_index import SeenUrlIndex
+from retry_queue import RetryQueue
+from inverted_index import InvertedIndex
+from article_labels import ArticleLabels
+from near_duplicates import NearDuplicateIndex, POLICIES, simhash
+
+
+class ScrapeProgress:
+    """State of a scrape running in the background, written by the scrape thread and read by the interface."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.stage = "REQUESTING PAGES"
+        self.url = ""
+        # Articles per outcome of NewsBotCore.process_result.
+        self.stored = 0
+        self.duplicate = 0
+        self.failed = 0
+        self.summary = ""
+        self.finished = False
+
+    def update(self, **changes) -> None:
+        with self._lock:
+            for name, value in changes.items():
+                setattr(self, name, value)
+
+    def snapshot(self) -> dict:
+        """A consistent copy of the state, to draw a frame from."""
+        with self._lock:
+            return {name: value for name, value in vars(self).items() if not name.startswith("_")}
+
+
+class NewsBotCore:
+    """Scraping, storage and filter management of NewsBot2000, without any user interface.
+       Shared by the curses application and the headless runner, so neither needs the other's imports."""
+
+    def __init__(self, database: str = "data.db", max_workers: int = 8, per_domain: int = 2,
+                 parse_workers: int = None, duplicate_policy: str = "flag", hedge_after: float = None) -> None:
+        """parse_workers: processes extracting and cleaning article text, by default one per core but one.
+           0 does it in the fetch threads and on the caller's thread instead.
+           duplicate_policy: "skip", "flag" or "link", what to do with near duplicates of stored articles.
+           hedge_after: seconds after which a slow request is sent again, None to never."""
+
+        if duplicate_policy not in POLICIES:
+            raise ValueError(f"Unknown duplicate policy {duplicate_policy!r}, expected one of {POLICIES}.")
+
+        # The news sites to scrape, with the precompiled rules for finding and extracting their articles.
+        self.site_profiles = load_profiles()
+
+        # Brings the schema up to date, creating it in a new database, which then gets the default filters.
+        self.db = {"database": database}
+
+        new = not sql.execute_query(self.db, "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'articles';")
+        migrate(self.db)
+        if new:
+            self.create_database(self.db)
+        # Stores the article texts compressed, once compression is turned on with content_codec.
+        self.codec = ContentCodec(self.db)
+
+        # Writes of stored articles, some 500 rows each with their postings,
+        # grouped into one transaction per 50 articles or quarter second.
+        self.writer = sql.BatchWriter(self.db, max_rows=25000)
+        # Canonical urls of all stored and failed articles, to avoid scraping the same article twice.
+        self.seen_urls = SeenUrlIndex(self.db, writer=self.writer)
+        # Failed scrapes, with the time each transient failure is due to be tried again.
+        self.retry_queue = RetryQueue(self.db, writer=self.writer)
+        # Fingerprints of the stored articles, to catch wire stories republished by several sites.
+        self.duplicates = NearDuplicateIndex(self.db, writer=self.writer)
+        self.duplicate_policy = duplicate_policy
+        # Term counts of the stored articles, for the statistics. Indexes articles stored before it existed.
+        self.index = InvertedIndex(self.db, writer=self.writer)
+        self.index.backfill()
+        # Main category of each stored article for the current filters. Labels any articles that lack one.
+        self.labels = ArticleLabels(self.db, writer=self.writer)
+        self.labels.refresh_in_background()
+
+        # Initiate the concurrent article scraper and text processor.
+        # max_workers=1, per_domain=1 runs the old sequential path, for comparison.
+        if parse_workers is None:
+            parse_workers = max((os.cpu_count() or 2) - 1, 1)
+        self.scrape_engine = ScrapeEngine(max_workers=max_workers, per_domain=per_domain,
+                                          client=HttpClient(pool_maxsize=per_domain, hedge_after=hedge_after,
+                                                            hedge_workers=max_workers + 1),
+                                          page_cache=PageCache(self.db), archive=HtmlArchive(self.db),
+                                          parse_workers=parse_workers, feed_state=FeedState(self.db))
+        self.text_cleaner = TextCleaner()
+
+    def create_database(self, database: str) -> None:
+        """Fills a new database with the default categories and keywords."""
+
+        # Define news categories and keywords
+        default_categories = {
+            'Business': ['economy', 'finance', 'market', 'investment', 'mergers', 'acquisitions', 'trade', 'industry', 'companies', 'stocks', 'bonds', 'startup', 'inflation'],
+            'Sports': ['athlete', 'team', 'competition', 'tournament', 'match', 'medal', 'record', 'championship', 'coach', 'stadium', 'player', 'league'],
+            'Technology': ['software', 'hardware', 'ai', 'cybersecurity', 'cloud', 'mobile', 'internet', 'electronics', 'innovation', 'gadget', 'robotics', 'cryptocurrency'],
+            'Politics': ['government', 'election', 'president', 'congress', 'senate', 'house', 'policy', 'bill', 'law', 'diplomacy', 'foreign', 'nation'],
+            'Entertainment': ['film', 'music', 'television', 'theater', 'comedy', 'dance', 'fashion', 'beauty', 'arts', 'media', 'pop', 'culture'],
+            'Health': ['medicine', 'disease', 'vaccine', 'nutrition', 'fitness', 'wellness', 'therapy', 'rehabilitation', 'lifestyle', 'doctor', 'pharmaceuticals', 'surgery'],
+            'Science': ['biology', 'chemistry', 'astronomy', 'climate', 'environment', 'evolution', 'geology', 'oceanography', 'physics', 'research', 'invention', 'space'],
+            'World News': ['war', 'conflict', 'peace', 'terrorism', 'human rights', 'disaster', 'refugee', 'immigration', 'politics', 'geopolitics', 'diplomat', 'humanitarian', 'ukraine'],
+            'Crime': ['murder', 'theft', 'robbery', 'fraud', 'cybercrime', 'police', 'kidnapping', 'smuggling', 'counterfeiting', 'illegal', 'arrest', 'bribery'],
+            'Environment': ["climate change", "global warming", "greenhouse gases", "renewable energy", "carbon emissions", "sustainability", "climate crisis", "oil spill", "environmental protection", "biodiversity", "ice caps", "environmental justice"]
+        }
+
+        # Insert categories (keys from the above dict)
+        for category, keywords_list in default_categories.items():
+            sql.execute_query(database, "INSERT INTO categories (category) VALUES (?);", (category,))
+
+            # Get the serial id from the category table for use as foreign key for keywords.
+            category_id = sql.execute_query(
+                database, "SELECT id FROM categories WHERE category = ?;", (category,))[0][0]
+            sql.execute_many(database, "INSERT INTO keywords (keyword, category_id) VALUES (?, ?);",
+                             [(keyword, category_id) for keyword in keywords_list])
+
+    def fetch_filters_from_db(self):
+        """Fetches and matches keywords with categories."""
+        # Get categories andd assign as keys in a new dictionary
+        cats = sql.execute_query(self.db, "SELECT * FROM categories;")
+        categories = {item[1]: item[0] for item in cats}
+        # Get keywords and assign into lists of values for each category
+        for key in categories:
+            categories[key] = [keyword[0] for keyword in sql.execute_query(
+                self.db, "SELECT keyword FROM keywords WHERE category_id = ?;", (categories[key],))]
+        return categories
+
+    def add_category(self, category: str) -> None:
+        sql.execute_query(self.db, "INSERT INTO categories (category) VALUES (?);", (category,))
+        self.labels.refresh_in_background()
+
+    def add_keyword(self, keyword: str, category: str) -> None:
+        # Get the id for the category to be used as foreign key for the keyword.
+        cat_id = sql.execute_query(
+            self.db, "SELECT id FROM categories WHERE category = ?;", (category,))[0][0]
+        # Store the new keyword in the database, with foreign key referring to the category.
+        sql.execute_query(self.db, "INSERT INTO keywords (keyword, category_id) VALUES (?, ?);", (keyword, cat_id))
+        # Relabels the articles holding the new keyword.
+        self.labels.refresh_in_background()
+
+    def delete_filter_from_database(self, *, category: str = None, keyword: str = None) -> None:
+
+        if category:
+            # Delete the cateogry
+            sql.execute_query(self.db, "DELETE FROM categories WHERE category = ?;", (category,))
+        elif keyword:
+            # Delete the keyword
+            sql.execute_query(self.db, "DELETE FROM keywords WHERE keyword = ?;", (keyword,))
+        self.labels.refresh_in_background()
+
+    def export_urls(self):
+        """Saves all article urls to at txt file."""
+
+        article_urls = (url[0] for url in sql.execute_query(
+            self.db, "SELECT url FROM articles;"))
+        with open("urls.txt", "w") as f:
+            for url in article_urls:
+                f.write(url + "\n")
+
+    def scrape(self):
+        """Runs the scrape engine over all sites, retries due first. Yields a ScrapeResult per article url."""
+        return self.scrape_engine.run(self.site_profiles, self.seen_urls,
+                                      retries=self.retry_queue.due(self.site_profiles))
+
+    def flush(self) -> None:
+        """Writes the stored articles still buffered. Done at the end of every scrape, cancelled or not."""
+        self.writer.flush()
+
+    def store_failure(self, result: ScrapeResult) -> None:
+        """Stores a failed scrape in failed_scrapes, to be retried later if the error was transient."""
+        self.retry_queue.record_failure(result.url, result.error)
+        self.seen_urls.add(result.url)
+
+    def store_article(self, url: str, list_of_words: str) -> str:
+        """Stores a cleaned article, unless the duplicate policy skips it.
+           Returns "duplicate" for near duplicates of a stored article, otherwise "stored"."""
+
+        fingerprint = simhash(list_of_words)
+        duplicate_of = self.duplicates.find(fingerprint)
+
+        # The article, its postings, label, daily counts and seen url are committed together or not at all.
+        with self.writer.group():
+            if duplicate_of and self.duplicate_policy == "skip":
+                logging.info(f"Skipped {url}, near duplicate of {duplicate_of}")
+            else:
+                # Linked duplicates keep only the reference to the original.
+                content = "" if duplicate_of and self.duplicate_policy == "link" else list_of_words
+                scrape_date = str(datetime.now().date())
+                self.writer.add("INSERT INTO articles (url, scrape_date, content, duplicate_of) VALUES (?, ?, ?, ?);",
+                                (url, scrape_date, self.codec.encode(content), duplicate_of))
+                if content:
+                    self.index.add(url, content)
+                self.labels.add(url, content, scrape_date, duplicate=bool(duplicate_of))
+                if not duplicate_of:
+                    self.duplicates.add(url, fingerprint)
+
+            self.seen_urls.add(url)
+            # No-op unless this was a retry of an earlier failure.
+            self.retry_queue.resolve(url)
+        return "duplicate" if duplicate_of else "stored"
+
+    def process_result(self, result: ScrapeResult) -> str:
+        """Cleans and stores a scraped article, or records the failure. Returns "stored", "duplicate" or "failed"."""
+
+        if result.error or not result.text:
+            self.store_failure(result)
+            return "failed"
+
+        # Clean the text and turn into list of list of words, unless the parse stage already did.
+        list_of_words = result.words if result.words is not None else self.text_cleaner.clean_text(result.text)
+        return self.store_article(result.url, list_of_words)
+
+    def scrape_in_background(self, progress: ScrapeProgress) -> threading.Thread:
+        """Runs a scrape on its own thread, storing the results and reporting to progress as it goes.
+           Stop it with scrape_engine.cancel()."""
+
+        def scrape_and_store():
+            results = self.scrape()
+            try:
+                for result in results:
+                    progress.update(stage="SCRAPING ARTICLES", url=result.url)
+                    outcome = self.process_result(result)
+                    progress.update(**{outcome: getattr(progress, outcome) + 1})
+            except Exception as e:
+                logging.error(e, exc_info=True)
+            finally:
+                results.close()
+                self.flush()
+                progress.update(summary=self.scrape_engine.summary(), finished=True)
+
+        thread = threading.Thread(target=scrape_and_store, name="scrape", daemon=True)
+        thread.start()
+        return thread
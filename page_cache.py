@@ -0,0 +1,58 @@
+import hashlib
+
+import sql_manager as sql
+
+
+class PageCache:
+    """Persistent HTTP validator cache for front pages, stored in the database.
+       Remembers each page's ETag / Last-Modified, a hash of its body and the links found on it,
+       so an unchanged page is neither downloaded (304) nor parsed again (same body hash)."""
+
+    def __init__(self, database: dict) -> None:
+
+        self.db = database
+        sql.execute_query(self.db, """
+                          CREATE TABLE IF NOT EXISTS page_cache(
+                          url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, body_hash TEXT, hrefs TEXT);""")
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.not_modified = 0
+        self.same_body = 0
+        self.misses = 0
+
+    def lookup(self, url: str) -> dict:
+        """Returns the cached entry for a page url, or None."""
+        rows = sql.execute_query(
+            self.db, "SELECT etag, last_modified, body_hash, hrefs FROM page_cache WHERE url = ?;", (url,))
+        if not rows:
+            return None
+        etag, last_modified, body_hash, hrefs = rows[0]
+        return {"etag": etag, "last_modified": last_modified, "body_hash": body_hash,
+                "hrefs": hrefs.split("\n") if hrefs else []}
+
+    @staticmethod
+    def validators(entry: dict) -> dict:
+        """Conditional request headers for a cached entry."""
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    @staticmethod
+    def body_hash(content: bytes) -> str:
+        return hashlib.sha1(content).hexdigest()
+
+    def store(self, url: str, response, body_hash: str, hrefs: list) -> None:
+        sql.execute_query(self.db, """
+                          INSERT OR REPLACE INTO page_cache (url, etag, last_modified, body_hash, hrefs)
+                          VALUES (?, ?, ?, ?, ?);""",
+                          (url, response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                           body_hash, "\n".join(hrefs)))
+
+    def summary(self) -> str:
+        hits = self.not_modified + self.same_body
+        return (f"Page cache: {hits} hits ({self.not_modified} not modified, {self.same_body} same body), "
+                f"{self.misses} misses")
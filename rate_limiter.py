@@ -0,0 +1,103 @@
+import threading
+from time import monotonic, sleep
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+def parse_retry_after(value: str) -> float:
+    """Seconds to wait from a Retry-After header, given either as seconds or as an HTTP date. None if unreadable."""
+
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        until = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((until - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class TokenBucket:
+    """Request budget of a single domain. Refills at `rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+        # Set after a 429 or 5xx, no requests are let through before this time.
+        self.blocked_until = 0.0
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class DomainRateLimiter:
+    """Per-domain token buckets with AIMD rate control: every successful response raises a domain's rate a little,
+       a 429 or 5xx cuts it by a factor and pauses the domain, for as long as Retry-After asks if given."""
+
+    def __init__(self, initial_rate: float = 2.0, min_rate: float = 0.2, max_rate: float = 20.0,
+                 increase: float = 0.25, decrease: float = 0.5, burst: float = 2.0, max_pause: float = 60.0) -> None:
+
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        # Upper bound on a Retry-After pause, so one site can't park the scraper for hours.
+        self.max_pause = max_pause
+
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, domain: str) -> TokenBucket:
+        if domain not in self._buckets:
+            self._buckets[domain] = TokenBucket(self.initial_rate, self.burst)
+        return self._buckets[domain]
+
+    def acquire(self, domain: str) -> None:
+        """Blocks until the domain may be sent another request."""
+
+        while True:
+            with self._lock:
+                bucket = self._bucket(domain)
+                now = monotonic()
+                bucket.refill(now)
+                if now < bucket.blocked_until:
+                    delay = bucket.blocked_until - now
+                elif bucket.tokens >= 1:
+                    bucket.tokens -= 1
+                    return
+                else:
+                    delay = (1 - bucket.tokens) / bucket.rate
+            # Sleep outside the lock so other domains are not held up.
+            sleep(delay)
+
+    def feedback(self, domain: str, status_code: int = None, retry_after: float = None) -> None:
+        """Adjusts the domain's rate after a response. status_code None means the request failed without one."""
+
+        with self._lock:
+            bucket = self._bucket(domain)
+            if status_code is not None and status_code != 429 and status_code < 500:
+                # Additive increase
+                bucket.rate = min(self.max_rate, bucket.rate + self.increase)
+                return
+
+            # Multiplicative decrease, and no more requests until the pause is over.
+            bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+            bucket.tokens = 0
+            pause = min(retry_after if retry_after is not None else 1 / bucket.rate, self.max_pause)
+            bucket.blocked_until = max(bucket.blocked_until, monotonic() + pause)
+
+    def rates(self) -> dict:
+        """Current requests per second allowed for each domain."""
+        with self._lock:
+            return {domain: round(bucket.rate, 2) for domain, bucket in self._buckets.items()}
+
+    def summary(self) -> str:
+        rates = ", ".join(f"{domain} {rate}/s" for domain, rate in sorted(self.rates().items()))
+        return f"Rate limits: {rates or 'no requests'}"
@@ -0,0 +1,106 @@
+import logging
+import argparse
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+
+import sql_manager as sql
+from migrations import migrate
+from html_archive import HtmlArchive
+from content_codec import ContentCodec
+from inverted_index import InvertedIndex
+from article_labels import ArticleLabels
+from text_cleaner import TextCleaner
+from article_scraper import ArticleScraper
+from site_profiles import load_profiles, profile_for_url
+
+
+def _reextract_one(job: tuple) -> tuple:
+    """Process pool job: extract and clean the text of one archived page. Returns (url, scrape_date, words or None)."""
+
+    url, scrape_date, content_hash, directory, profile = job
+    try:
+        html = HtmlArchive.read_blob(directory, content_hash)
+        text = ArticleScraper.extract_text(html, profile, url)
+    except Exception:
+        return url, scrape_date, None
+    if not text:
+        return url, scrape_date, None
+    return url, scrape_date, TextCleaner().clean_text(text)
+
+
+def reextract_articles(database: dict, profiles: tuple = None, directory: str = "html_archive",
+                       workers: int = None, batch_size: int = 200) -> dict:
+    """Runs extraction and cleaning again over every archived page, in parallel and without any network I/O.
+       Stored articles get their content replaced, failed scrapes that now extract are moved into articles.
+       Near duplicates are left alone, both the linked ones and the pages skipped without being stored."""
+
+    started = perf_counter()
+    profiles = profiles if profiles is not None else load_profiles()
+    rows = sql.execute_query(database, """
+                             SELECT h.url, COALESCE(a.scrape_date, f.scrape_date, h.archive_date), h.content_hash
+                             FROM html_archive h
+                             LEFT JOIN articles a ON a.url = h.url
+                             LEFT JOIN failed_scrapes f ON f.url = h.url
+                             WHERE (a.url IS NOT NULL AND a.duplicate_of IS NULL)
+                             OR (a.url IS NULL AND f.url IS NOT NULL);""")
+
+    jobs = []
+    for url, scrape_date, content_hash in rows:
+        profile = profile_for_url(url, profiles)
+        if profile:
+            jobs.append((url, scrape_date, content_hash, directory, profile))
+
+    counts = {"archived": len(rows), "extracted": 0, "failed": 0}
+    batch = []
+    index = InvertedIndex(database)
+    labels = ArticleLabels(database)
+    codec = ContentCodec(database)
+
+    def flush():
+        # Upsert keeps the row (and its original scrape date) of already stored articles.
+        sql.execute_many(database, """
+                         INSERT INTO articles (url, scrape_date, content) VALUES (?, ?, ?)
+                         ON CONFLICT(url) DO UPDATE SET content = excluded.content;""",
+                         [(url, scrape_date, codec.encode(words)) for url, scrape_date, words in batch])
+        sql.execute_many(database, "DELETE FROM failed_scrapes WHERE url = ?;", [(row[0],) for row in batch])
+        # The new texts replace the old ones' term counts and labels.
+        for url, _, words in batch:
+            index.add(url, words)
+            labels.add(url, words)
+        batch.clear()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for url, scrape_date, words in pool.map(_reextract_one, jobs, chunksize=16):
+            if words is None:
+                counts["failed"] += 1
+                continue
+            counts["extracted"] += 1
+            batch.append((url, scrape_date, words))
+            if len(batch) >= batch_size:
+                flush()
+    if batch:
+        flush()
+
+    # The new texts change the daily keyword counts.
+    labels.refresh()
+    labels.rollups.rebuild(labels)
+
+    counts["seconds"] = round(perf_counter() - started, 2)
+    logging.info(f"Re-extracted archive: {counts}")
+    return counts
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Re-extract all archived article HTML into the database.")
+    parser.add_argument("--database", default="data.db")
+    parser.add_argument("--archive", default="html_archive", help="Archive directory.")
+    parser.add_argument("--workers", type=int, default=None, help="Parse processes, defaults to the core count.")
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = {"database": args.database}
+    migrate(db)
+    print(reextract_articles(db, directory=args.archive,
+                             workers=args.workers, batch_size=args.batch_size))
@@ -0,0 +1,89 @@
+import requests
+from datetime import datetime, timedelta
+
+import sql_manager as sql
+from http_client import HttpStatusError, BodyTooLarge
+from site_profiles import profile_for_url
+
+# Status codes worth asking for again later, anything else in the 4xx range won't change.
+TRANSIENT_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+
+
+def classify_error(error: Exception) -> str:
+    """"transient" for failures that may go away (timeouts, dropped connections, 5xx),
+        "permanent" for pages that will never parse or no longer exist."""
+
+    if error is None:
+        # The page was fetched and parsed, but had no text.
+        return "permanent"
+    if isinstance(error, HttpStatusError):
+        return "transient" if error.status_code in TRANSIENT_STATUSES else "permanent"
+    if isinstance(error, TypeError):
+        # ArticleScraper's structural errors: no article tag, too few paragraphs.
+        return "permanent"
+    if isinstance(error, BodyTooLarge):
+        return "permanent"
+    if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+        return "transient"
+    # Unknown errors get the retries, until max_attempts gives up on them.
+    return "transient"
+
+
+class RetryQueue:
+    """Failed scrapes with an attempt count, error class and time of next attempt, kept in the failed_scrapes table.
+       Transient failures are retried with exponential backoff, permanent ones and those out of attempts never are.
+       The retry columns are added by migrations."""
+
+    def __init__(self, database: dict, base_delay: timedelta = timedelta(hours=1), max_attempts: int = 5,
+                 writer: sql.BatchWriter = None) -> None:
+
+        self.db = database
+        # Optional, buffers resolved urls to be deleted in batches instead of one transaction each.
+        self.writer = writer
+        self.base_delay = base_delay
+        self.max_attempts = max_attempts
+
+    def record_failure(self, url: str, error: Exception = None) -> None:
+        """Stores a failed scrape, or counts another attempt of one already stored."""
+
+        now = datetime.now()
+        rows = sql.execute_query(self.db, "SELECT attempts FROM failed_scrapes WHERE url = ?;", (url,))
+        attempts = rows[0][0] + 1 if rows else 1
+
+        error_class = classify_error(error)
+        if attempts >= self.max_attempts:
+            error_class = "permanent"
+        # 1, 2, 4, 8... times the base delay.
+        next_attempt = now + self.base_delay * 2 ** (attempts - 1) if error_class == "transient" else None
+
+        sql.execute_query(self.db, """
+                          INSERT INTO failed_scrapes (url, scrape_date, error_message, attempts, next_attempt, error_class)
+                          VALUES (?, ?, ?, ?, ?, ?)
+                          ON CONFLICT(url) DO UPDATE SET
+                          error_message = excluded.error_message, attempts = excluded.attempts,
+                          next_attempt = excluded.next_attempt, error_class = excluded.error_class;""",
+                          (url, str(now.date()), str(error) if error else "No text found", attempts,
+                           next_attempt.isoformat(sep=" ", timespec="seconds") if next_attempt else None, error_class))
+
+    def resolve(self, url: str) -> None:
+        """Removes a url that has now been scraped successfully."""
+        query = "DELETE FROM failed_scrapes WHERE url = ?;"
+        if self.writer:
+            self.writer.add(query, (url,))
+        else:
+            sql.execute_query(self.db, query, (url,))
+
+    def due(self, profiles: tuple = None, limit: int = 500) -> list:
+        """Returns (url, profile) for transient failures whose next attempt time has come."""
+
+        now = datetime.now().isoformat(sep=" ", timespec="seconds")
+        rows = sql.execute_query(self.db, """
+                                 SELECT url FROM failed_scrapes
+                                 WHERE error_class = 'transient' AND next_attempt <= ?
+                                 ORDER BY next_attempt LIMIT ?;""", (now, limit))
+        due = []
+        for (url,) in rows:
+            profile = profile_for_url(url, profiles)
+            if profile:
+                due.append((url, profile))
+        return due
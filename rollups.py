@@ -0,0 +1,94 @@
+import argparse
+
+import sql_manager as sql
+
+
+class DailyRollups:
+    """Keyword hits and articles per main category, per scrape date, of the original articles (not near duplicates).
+       Counted up as each article is stored, in its write group (see BatchWriter.group), so the statistics read
+       a few rows per day instead of the whole archive.
+       Category counts are kept per filter version, like the labels they count.
+       The tables are created by migration 9."""
+
+    def __init__(self, database: dict, writer: sql.BatchWriter = None) -> None:
+
+        self.db = database
+        # Optional, buffers the counts to be written in batches, in the transaction of their article.
+        self.writer = writer
+
+    def add(self, date: str, keyword_hits: dict, version: str, category: str) -> None:
+        """Counts a stored original article in."""
+
+        statements = [("""INSERT INTO daily_keyword_counts (date, keyword, count) VALUES (?, ?, ?)
+                          ON CONFLICT DO UPDATE SET count = count + excluded.count;""",
+                       [(date, keyword, count) for keyword, count in keyword_hits.items()]),
+                      ("""INSERT INTO daily_category_counts (version, date, category, articles) VALUES (?, ?, ?, 1)
+                          ON CONFLICT DO UPDATE SET articles = articles + 1;""",
+                       [(version, date, category)] if category else [])]
+        if self.writer:
+            for query, rows in statements:
+                self.writer.add_many(query, rows)
+        else:
+            with sql.ConnectionManager(self.db) as cm:
+                for query, rows in statements:
+                    cm.cursor.executemany(query, rows)
+
+    def rebuild(self, labels) -> None:
+        """Counts everything again, from the articles' labels of the current version and the keyword indexes.
+           labels: the ArticleLabels to read them from."""
+
+        classifier = labels.classifier
+        # Read inside the write transaction, so no article can be counted in between.
+        with sql.ConnectionManager(self.db) as cm:
+            dates = dict(sql.execute_query(self.db,
+                                           "SELECT rowid, scrape_date FROM articles WHERE duplicate_of IS NULL;"))
+            keyword_counts = {}
+            for article_id, hits in labels.hits_of_all(classifier).items():
+                if article_id in dates:
+                    for keyword, count in hits.items():
+                        key = (dates[article_id], keyword)
+                        keyword_counts[key] = keyword_counts.get(key, 0) + count
+
+            cm.cursor.execute("DELETE FROM daily_keyword_counts;")
+            cm.cursor.executemany("INSERT INTO daily_keyword_counts (date, keyword, count) VALUES (?, ?, ?);",
+                                  [(date, keyword, count) for (date, keyword), count in keyword_counts.items()])
+            cm.cursor.execute("DELETE FROM daily_category_counts;")
+            cm.cursor.execute("""
+                              INSERT INTO daily_category_counts (version, date, category, articles)
+                              SELECT l.version, a.scrape_date, l.category, COUNT(*) FROM article_labels l
+                              JOIN articles a ON a.rowid = l.article_id
+                              WHERE l.version = ? AND a.duplicate_of IS NULL AND l.category IS NOT NULL
+                              GROUP BY a.scrape_date, l.category;""", (classifier.version,))
+
+    def keyword_totals(self) -> dict:
+        """{keyword: hits} of the keywords found in any original article, summed over all days."""
+        return dict(sql.execute_query(self.db,
+                                      "SELECT keyword, SUM(count) FROM daily_keyword_counts GROUP BY keyword;"))
+
+    def top_categories_by_date(self, version: str, per_day: int = 3) -> list:
+        """(date, category, articles) of the per_day categories with the most articles each day, latest day first."""
+
+        return sql.execute_query(self.db, """
+                                 SELECT date, category, articles FROM (
+                                     SELECT date, category, articles,
+                                     ROW_NUMBER() OVER (PARTITION BY date ORDER BY articles DESC, category) AS rank
+                                     FROM daily_category_counts WHERE version = ?)
+                                 WHERE rank <= ? ORDER BY date DESC, articles DESC;""", (version, per_day))
+
+
+if __name__ == "__main__":
+
+    from migrations import migrate
+    from article_labels import ArticleLabels
+
+    parser = argparse.ArgumentParser(description="Rebuild the daily keyword and category counts from scratch.")
+    parser.add_argument("--database", default="data.db")
+    args = parser.parse_args()
+
+    # Labels every article for the current filters first, which also rebuilds the counts when it changes any.
+    db = {"database": args.database}
+    migrate(db)
+    labels = ArticleLabels(db)
+    labels.refresh()
+    labels.rollups.rebuild(labels)
+    print("Rebuilt the daily counts.")
@@ -0,0 +1,282 @@
+import logging
+import threading
+from itertools import chain
+from collections import Counter, defaultdict, deque
+from time import perf_counter
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from http_client import HttpClient, url_domain
+from page_cache import PageCache
+from html_archive import HtmlArchive
+from url_scraper import UrlScraper
+from feed_scraper import FeedScraper, FeedState
+from article_scraper import ArticleScraper
+from site_profiles import SiteProfile
+from url_index import canonical_url
+from text_cleaner import TextCleaner
+
+
+class ScrapeResult(NamedTuple):
+    """Outcome of scraping a single article url. Either text or error is set.
+       words is the cleaned text, when the parse stage already cleaned it."""
+
+    url: str
+    profile: SiteProfile
+    text: str = None
+    error: Exception = None
+    words: str = None
+
+
+# One cleaner per parse process, created on its first job.
+_text_cleaner = None
+
+
+def _extract_and_clean(url: str, profile: SiteProfile, html: str) -> tuple:
+    """Parse stage job, run in a worker process: article text extraction and cleaning, never raising.
+       Returns (ScrapeResult, seconds of work)."""
+
+    global _text_cleaner
+    started = perf_counter()
+    try:
+        text = ArticleScraper.extract_text(html, profile, url)
+        if _text_cleaner is None:
+            _text_cleaner = TextCleaner()
+        result = ScrapeResult(url, profile, text=text, words=_text_cleaner.clean_text(text) if text else None)
+    except Exception as e:
+        result = ScrapeResult(url, profile, error=e)
+    return result, perf_counter() - started
+
+
+class ScrapeEngine:
+    """Scrapes articles concurrently in a thread pool, with a global and a per-domain cap on simultaneous requests.
+       max_workers=1 gives the old sequential behaviour, for comparison.
+
+       Discovery takes turns between the sites, and the urls wait in a queue per domain. A url is only handed to the
+       pool when its domain has a free slot, so the threads fetch from as many domains at once as they can.
+
+       With parse_workers set, the work is split in stages: the threads only fetch, the raw HTML goes to a pool of
+       parse_workers processes for text extraction and cleaning, and the caller stores the results (the writer).
+       Each stage holds at most twice its worker count in flight, so a slow stage holds back the one before it."""
+
+    def __init__(self, max_workers: int = 8, per_domain: int = 2,
+                 page_cache: PageCache = None, archive: HtmlArchive = None, client: HttpClient = None,
+                 parse_workers: int = 0, feed_state: FeedState = None) -> None:
+
+        self.max_workers = max_workers
+        self.per_domain = per_domain
+        self.parse_workers = parse_workers
+        self.page_cache = page_cache
+        self.feed_state = feed_state
+
+        # One pooled client for both scrapers, keeping as many connections per host as the per-domain cap allows.
+        self.client = client or HttpClient(pool_maxsize=per_domain)
+        self.article_scraper = ArticleScraper(self.client, archive)
+
+        self._busy_lock = threading.Lock()
+        self._cancelled = threading.Event()
+
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.started = None
+        self.finished = None
+        self.scraped = 0
+        self.failed = 0
+        # Seconds spent working in each stage, summed over its workers.
+        self.busy = {"fetch": 0.0, "parse": 0.0, "write": 0.0}
+        if self.page_cache:
+            self.page_cache.reset_stats()
+
+    def _site_urls(self, profile: SiteProfile):
+        """Yields (article_url, profile) for every article url found in the site's feeds or on its front pages."""
+        if profile.discovery == "feeds":
+            urls = FeedScraper(self.client, self.feed_state).discover(profile)
+            if urls is not None:
+                for article_url in urls:
+                    yield article_url, profile
+                return
+            logging.warning(f"No feed of {profile.name} could be read, crawling its front pages instead.")
+
+        for url in profile.urls:
+            if self._cancelled.is_set():
+                return
+            for article_url in UrlScraper(self.client, self.page_cache).generator(url, profile):
+                yield article_url, profile
+
+    def _discover(self, profiles: tuple):
+        """Yields (article_url, profile) for every article url of the sites, taking turns between the sites."""
+        sites = deque(self._site_urls(profile) for profile in profiles)
+        while sites and not self._cancelled.is_set():
+            site = sites.popleft()
+            found = next(site, None)
+            if found is not None:
+                sites.append(site)
+                yield found
+
+    def _add_busy(self, stage: str, seconds: float) -> None:
+        with self._busy_lock:
+            self.busy[stage] += seconds
+
+    def _scrape(self, article_url: str, profile: SiteProfile, fetch_only: bool = False) -> ScrapeResult:
+        """Fetch stage job: scrape one article, never raising. None if the scrape was cancelled before it started.
+           fetch_only: leave the raw HTML in text, for the parse stage."""
+        if self._cancelled.is_set():
+            return None
+        started = perf_counter()
+        try:
+            if fetch_only:
+                text = self.article_scraper.fetch_html(article_url)
+            else:
+                text = self.article_scraper.scrape_text(article_url, profile)
+        except Exception as e:
+            return ScrapeResult(article_url, profile, error=e)
+        finally:
+            self._add_busy("fetch", perf_counter() - started)
+        return ScrapeResult(article_url, profile, text=text)
+
+    def _hand_over(self, result: ScrapeResult):
+        """Updates the counters and yields a finished result, timing the caller's work on it as the write stage."""
+        if result.text:
+            self.scraped += 1
+        else:
+            self.failed += 1
+        started = perf_counter()
+        yield result
+        self._add_busy("write", perf_counter() - started)
+
+    def _advance(self, fetching: dict, parsing: dict, parse_pool: ProcessPoolExecutor, only_parsing: bool = False):
+        """Waits for the next finished jobs, passing fetched pages on to the parse stage and yielding parsed results.
+           fetching: {future: domain} of the fetch jobs, whose domain slot is freed as they finish."""
+
+        waiting = set(parsing) if only_parsing else set(fetching) | set(parsing)
+        done, _ = wait(waiting, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future not in fetching and future not in parsing:
+                # Already handed over by a nested wait on the parse stage.
+                continue
+            if future in parsing:
+                del parsing[future]
+                result, seconds = future.result()
+                self._add_busy("parse", seconds)
+                yield from self._hand_over(result)
+                continue
+
+            self._active[fetching.pop(future)] -= 1
+            result = future.result()
+            if result is None:
+                continue
+            if parse_pool is None or result.error:
+                yield from self._hand_over(result)
+                continue
+
+            # The parse stage is full, hand over parsed results before giving it more.
+            while len(parsing) >= self.parse_workers * 2:
+                yield from self._advance(fetching, parsing, parse_pool, only_parsing=True)
+            parsing[parse_pool.submit(_extract_and_clean, result.url, result.profile, result.text)] = result.url
+
+    def run(self, profiles: tuple, seen_urls, retries: list = ()):
+        """Yields a ScrapeResult for every article url not already in seen_urls, in order of completion.
+           Urls are compared in canonical form, so variants like "www.site.com" and "site.com" are fetched once.
+           retries: (url, profile) of earlier failures due another attempt, scraped first although already seen.
+           Results are produced by the worker threads, but are handed to the caller on its own thread."""
+
+        self._cancelled.clear()
+        self.reset_stats()
+        if self.feed_state:
+            self.feed_state.discard()
+        self.started = perf_counter()
+
+        queued = set()
+        # Fetch jobs in the pool, and the urls waiting for a slot of their domain.
+        fetching = {}
+        parsing = {}
+        self._active = Counter()
+        waiting = defaultdict(deque)
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="scraper")
+        parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers) if self.parse_workers else None
+        try:
+            jobs = chain(((url, profile, True) for url, profile in retries),
+                         ((url, profile, False) for url, profile in self._discover(profiles)))
+            discovering = True
+            while not self._cancelled.is_set():
+                # Fill the free workers from the domains with a free slot.
+                for domain in list(waiting):
+                    while (waiting[domain] and self._active[domain] < self.per_domain
+                           and len(fetching) < self.max_workers):
+                        article_url, profile = waiting[domain].popleft()
+                        self._active[domain] += 1
+                        fetching[pool.submit(self._scrape, article_url, profile, parse_pool is not None)] = domain
+                    if not waiting[domain]:
+                        del waiting[domain]
+
+                # Discover more while a worker is free, keeping the backlog short, so finished results are handed
+                # over while still discovering urls.
+                if (discovering and len(fetching) < self.max_workers
+                        and sum(map(len, waiting.values())) < self.max_workers * 2):
+                    found = next(jobs, None)
+                    if found is None:
+                        discovering = False
+                        continue
+                    article_url, profile, is_retry = found
+                    # Avoid scraping the same article twice, also when linked from several front pages.
+                    key = canonical_url(article_url)
+                    if key not in queued and (is_retry or article_url not in seen_urls):
+                        queued.add(key)
+                        waiting[url_domain(article_url)].append((article_url, profile))
+                    continue
+
+                if not (fetching or parsing):
+                    break
+                yield from self._advance(fetching, parsing, parse_pool)
+
+            # Every article discovered was handed over, the feeds needn't list them again.
+            if self.feed_state and not self._cancelled.is_set():
+                self.feed_state.save()
+        finally:
+            # Reached on completion, on cancel() and when the caller stops iterating.
+            pool.shutdown(wait=False, cancel_futures=True)
+            if parse_pool:
+                parse_pool.shutdown(wait=False, cancel_futures=True)
+            self.finished = perf_counter()
+            logging.info(self.summary())
+            logging.info(self.stage_summary())
+            logging.info(self.client.summary())
+            logging.info(self.client.latencies.summary())
+            logging.info(self.client.limiter.summary())
+            if self.page_cache:
+                logging.info(self.page_cache.summary())
+
+    def cancel(self) -> None:
+        """Stops discovery and retries, and drops any article urls not yet being fetched. Results of the fetches
+           still running are dropped too, the urls are found again by the next run."""
+        self._cancelled.set()
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or perf_counter()) - self.started
+
+    @property
+    def throughput(self) -> float:
+        """Successfully scraped articles per second."""
+        return self.scraped / self.elapsed if self.elapsed else 0.0
+
+    def utilisation(self) -> dict:
+        """Share of each stage's worker time spent working, 0 to 1. Near 1 means the stage is the bottleneck."""
+        if not self.elapsed:
+            return {stage: 0.0 for stage in self.busy}
+        workers = {"fetch": self.max_workers, "parse": self.parse_workers, "write": 1}
+        return {stage: self.busy[stage] / (self.elapsed * workers[stage]) if workers[stage] else 0.0
+                for stage in self.busy}
+
+    def stage_summary(self) -> str:
+        usage = self.utilisation()
+        parse = f"{usage['parse']:.0%} of {self.parse_workers} processes" if self.parse_workers else "in fetch threads"
+        return (f"Stages: fetch {usage['fetch']:.0%} of {self.max_workers} threads, parse {parse}, "
+                f"write {usage['write']:.0%}")
+
+    def summary(self) -> str:
+        return (f"Scraped {self.scraped} articles ({self.failed} failed) in {self.elapsed:.1f}s, "
+                f"{self.throughput:.2f} articles/s, {self.max_workers} workers, {self.per_domain} per domain")
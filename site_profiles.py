@@ -0,0 +1,103 @@
+import os
+import re
+import json
+from functools import lru_cache
+
+# The default registry, next to this file.
+PROFILES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "site_profiles.json")
+
+# Urls containing any of these are never scraped, for any site.
+GENERIC_URL_BLACKLIST = [r"mailto:?"]
+
+
+def _combine(patterns: list) -> re.Pattern:
+    """Compiles a list of regexes into a single alternation, or None for an empty list."""
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+
+
+class SiteProfile:
+    """The rules for finding and extracting the articles of one news site, compiled once into combined matchers.
+       urls: front pages to look for article links on, like "domain-name.com/section", without https:// and www.
+       regex_url_match: article links must match it. url_blacklist: links matching any of these are skipped.
+       tag_regex: class or id of the tag holding the article text. tag_blacklist: paragraph classes to leave out.
+       discovery: "frontpage" to find articles by crawling the urls, "feeds" to read the RSS feeds and news sitemaps
+       listed in feeds instead (falling back on the front pages when none of them can be read)."""
+
+    def __init__(self, name: str, urls: list, regex_url_match: str = None, url_blacklist: list = None,
+                 tag_regex: str = None, tag_blacklist: list = None,
+                 discovery: str = "frontpage", feeds: list = None) -> None:
+
+        self.name = name
+        self.urls = list(urls)
+        self.regex_url_match = regex_url_match
+        self.url_blacklist = list(url_blacklist or [])
+        self.tag_regex = tag_regex
+        self.tag_blacklist = list(tag_blacklist or [])
+        self.feeds = list(feeds or [])
+        self.discovery = discovery if self.feeds else "frontpage"
+
+        # Compiled matchers, built here and nowhere else.
+        self.url_match_re = re.compile(regex_url_match) if regex_url_match else None
+        self.url_blacklist_re = _combine(GENERIC_URL_BLACKLIST + self.url_blacklist)
+        self.tag_re = re.compile(tag_regex) if tag_regex else None
+        self.tag_blacklist_re = _combine(self.tag_blacklist)
+
+        # Links must be relative, or absolute to the site's own domain(s).
+        self.base_domains = sorted({re.sub("/.*", "", url) for url in self.urls})
+        self.own_link_re = re.compile(
+            r"^/|^https://(?:www\.)?(?:" + "|".join(re.escape(domain) for domain in self.base_domains) + ")")
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SiteProfile":
+        return cls(**data)
+
+    def __repr__(self) -> str:
+        return f"SiteProfile({self.name!r})"
+
+    def article_url(self, href: str, base_domain: str) -> str:
+        """Returns the absolute url of a link if it is an article of this site, otherwise None."""
+
+        # Don't scrape any useless urls.
+        if not self.own_link_re.search(href):
+            return None
+
+        # Exclude generic and site specific phrases in the urls, like "/gallery/" etc.
+        if self.url_blacklist_re.search(href):
+            return None
+
+        # Include only urls containing the required url component for that site, i.e. "/article/".
+        if self.url_match_re and not self.url_match_re.search(href):
+            return None
+
+        if href.startswith("/"):
+            href = "https://" + base_domain + href
+        return href
+
+    def keeps_paragraph(self, class_names: list) -> bool:
+        """False if any of a paragraph's class names is blacklisted for this site."""
+        if self.tag_blacklist_re is None:
+            return True
+        return not any(self.tag_blacklist_re.search(name) for name in class_names)
+
+    def owns_url(self, url: str) -> bool:
+        """True if an article url belongs to this site, by its domain."""
+        return re.sub(r"^https?://(www\.)?|/.*", "", url) in self.base_domains
+
+
+@lru_cache(maxsize=None)
+def load_profiles(path: str = PROFILES_PATH) -> tuple:
+    """Loads and compiles the site profiles of a JSON registry. Cached, so each file is compiled once per process."""
+
+    with open(path, encoding="utf-8") as f:
+        return tuple(SiteProfile.from_dict(data) for data in json.load(f))
+
+
+def profile_for_url(url: str, profiles: tuple = None) -> SiteProfile:
+    """Returns the profile an article url belongs to, or None."""
+
+    for profile in profiles if profiles is not None else load_profiles():
+        if profile.owns_url(url):
+            return profile
+    return None
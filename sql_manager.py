@@ -1,42 +1,301 @@
+import os
+import re
+import atexit
+import logging
 import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+from time import monotonic
+
+# Applied once to every new connection.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL;",       # Readers don't block the writer, nor the writer the readers.
+    "PRAGMA synchronous = NORMAL;",     # Safe with WAL, fsync at checkpoints instead of every commit.
+    "PRAGMA cache_size = -32000;",      # 32 MB page cache per connection.
+    "PRAGMA mmap_size = 268435456;",    # Read the first 256 MB of the file through memory mapping.
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA foreign_keys = True;",
+)
+
+# Prepared statements kept per connection.
+STATEMENT_CACHE = 256
+# Seconds to wait for a lock held by another process before giving up.
+BUSY_TIMEOUT = 30.0
+
+_local = threading.local()
+# Reentrant, a thread's connections may be closed by the garbage collector while it holds the lock.
+_registry_lock = threading.RLock()
+# Every open connection, and one write lock per database file.
+_connections = []
+_write_locks = {}
+# (name, number of arguments, factory) of SQL functions, see register_function.
+_functions = []
+# Words of the statements that write, in a WITH statement.
+_WRITE_KEYWORDS = re.compile(r"\b(INSERT|UPDATE|DELETE|REPLACE)\b")
+
+
+def _key(database: dict) -> tuple:
+    return tuple(sorted(database.items()))
+
+
+def _close(connections: list, pid: int) -> None:
+    """Closes the connections of a thread that ended. Not in a forked child, whose parent still uses them."""
+    if os.getpid() != pid:
+        return
+    with _registry_lock:
+        for connection in connections:
+            try:
+                connection.close()
+            except sqlite3.Error:
+                pass
+            if connection in _connections:
+                _connections.remove(connection)
+        connections.clear()
+
+
+class _ThreadConnections(dict):
+    """A thread's connections by database. Closed when the thread ends, and its thread-local data with it."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.opened = []
+        weakref.finalize(self, _close, self.opened, os.getpid())
+
+
+def _connection(database: dict) -> sqlite3.Connection:
+    """The calling thread's long-lived connection to a database, opened and tuned on first use.
+       Each thread has its own, so no connection is ever used by two threads at once.
+       It is closed as the thread ends."""
+
+    # A forked worker process must not reuse its parent's connections.
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.pid = os.getpid()
+        _local.connections = _ThreadConnections()
+
+    key = _key(database)
+    connection = _local.connections.get(key)
+    if connection is None:
+        # isolation_level=None: transactions are begun and committed explicitly, by ConnectionManager.
+        connection = sqlite3.connect(**{"timeout": BUSY_TIMEOUT, **database}, isolation_level=None,
+                                     cached_statements=STATEMENT_CACHE, check_same_thread=False)
+        for pragma in PRAGMAS:
+            connection.execute(pragma)
+        _local.connections[key] = connection
+        _local.connections.opened.append(connection)
+        with _registry_lock:
+            for name, arguments, factory in _functions:
+                connection.create_function(name, arguments, factory(connection), deterministic=True)
+            _connections.append(connection)
+    return connection
+
+
+def register_function(name: str, arguments: int, factory) -> None:
+    """Makes a Python function callable from SQL on every connection, those open already and those to come.
+       factory(connection) returns the function for one connection."""
+
+    with _registry_lock:
+        _functions.append((name, arguments, factory))
+        for connection in _connections:
+            connection.create_function(name, arguments, factory(connection), deterministic=True)
+
+
+def _write_lock(database: dict) -> threading.RLock:
+    with _registry_lock:
+        return _write_locks.setdefault(_key(database), threading.RLock())
+
+
+def _is_read(query: str) -> bool:
+    """True for statements that only read, which run without a transaction or the write lock.
+       A WITH statement reads unless it names a write anywhere, erring on the side of a write."""
+    statement = query.lstrip().upper()
+    if statement.startswith("WITH"):
+        return _WRITE_KEYWORDS.search(statement) is None
+    return statement.startswith(("SELECT", "EXPLAIN")) or (statement.startswith("PRAGMA") and "=" not in statement)
+
+
+@atexit.register
+def close_connections() -> None:
+    """Closes every connection, checkpointing the WAL into the database file. Called at exit."""
+    with _registry_lock:
+        for connection in _connections:
+            try:
+                connection.close()
+            except sqlite3.Error:
+                pass
+        _connections.clear()
 
 
 class ConnectionManager:
-    """A context manager for sqlite3 connections, allowing use of "with ContextManager as x:"""
+    """A context manager for a transaction on the thread's long-lived sqlite3 connection,
+       allowing use of "with ConnectionManager(database) as x:".
+       Writes are serialised by a per-database lock, reads run alongside them (WAL) without one.
+       A write opened inside another on the same thread joins its transaction."""
 
-    def __init__(self, database: dict):
+    def __init__(self, database: dict, write: bool = True):
         self.database = database
+        self.write = write
 
     def __enter__(self):
         """This is what is run as the "with" block opens"""
 
-        self.connection = sqlite3.connect(**self.database)
+        self.connection = _connection(self.database)
         self.cursor = self.connection.cursor()
-        self.cursor.execute("BEGIN;")
-        self.cursor.execute('PRAGMA foreign_keys = True;')
+        if self.write:
+            self.lock = _write_lock(self.database)
+            self.lock.acquire()
+            # Only the outermost write begins and ends the transaction.
+            self.outermost = not self.connection.in_transaction
+            if self.outermost:
+                try:
+                    self.cursor.execute("BEGIN IMMEDIATE;")
+                except BaseException:
+                    self.lock.release()
+                    raise
         return self
 
     def __exit__(self, exc_class, exc, traceback):
-        """This is what always happens when the "with" block closes, even in case of exceptions."""
+        """This is what always happens when the "with" block closes, even in case of exceptions.
+           Commits, or rolls back if the block raised. The exception is passed on either way."""
 
         try:
-            # Commit any changes before closing.
-            self.connection.commit()
-        except AttributeError:
-            self.cursor.execute("ROLLBACK;")
-            return True  # exception handled successfully
+            if self.write and self.outermost:
+                self.cursor.execute("COMMIT;" if exc_class is None else "ROLLBACK;")
         finally:
-            self.connection.close()
+            self.cursor.close()
+            if self.write:
+                self.lock.release()
 
-    def _execute(self, query: str):
+    def _execute(self, query: str, params: tuple = ()):
         """Returns the result of the SQL query."""
 
-        self.cursor.execute(query)
+        self.cursor.execute(query, params)
         return self.cursor.fetchall()
 
 
-def execute_query(database: dict, query: str):
-    """Runs the ConnectionManager as context manager, handling any exceptions and closing connections."""
+def execute_query(database: dict, query: str, params: tuple = ()):
+    """Runs the query in a ConnectionManager, on the thread's pooled connection.
+       Values in params are bound to the "?" placeholders in the query."""
+
+    with ConnectionManager(database, write=not _is_read(query)) as cm:
+        return (cm._execute(query, params))
+
+
+def execute_many(database: dict, query: str, rows: list) -> None:
+    """Runs the same query once per row of parameters, all in one transaction."""
 
     with ConnectionManager(database) as cm:
-        return (cm._execute(query))
+        cm.cursor.executemany(query, rows)
+
+
+class BatchWriter:
+    """Buffers parameterised writes and runs them with executemany, all in one transaction,
+       once max_rows rows are waiting or the oldest has waited max_delay seconds.
+       Statements run in the order they were added. Those added with add_group(), or in a group() block,
+       are never split between two transactions. flush() writes everything still buffered,
+       call it before reading back what was written. Whatever is left is flushed at exit."""
+
+    def __init__(self, database: dict, max_rows: int = 50, max_delay: float = 0.25) -> None:
+        self.database = database
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+
+        self._lock = threading.Lock()
+        # Writes collected by group(), per thread.
+        self._local = threading.local()
+        # Wakes the flusher thread when the first rows of a batch come in.
+        self._added = threading.Condition(self._lock)
+        # Held through a whole flush, so batches are committed in the order they were taken.
+        self._flush_lock = threading.Lock()
+        # [query, rows] groups, consecutive rows of the same query share a group.
+        self._groups = []
+        self._count = 0
+        # When the oldest buffered row came in.
+        self._oldest = None
+        # One long-lived thread flushing batches that wait too long, started with the first rows.
+        self._flusher = None
+        # Batches committed so far. Rows added while it read n are committed once it reads n + 2.
+        self.flushes = 0
+        atexit.register(self.flush)
+
+    def add(self, query: str, params: tuple = ()) -> None:
+        self.add_many(query, [params])
+
+    def add_many(self, query: str, rows: list) -> None:
+        if getattr(self._local, "group", None) is not None:
+            self._local.group.append((query, rows))
+        else:
+            self.add_group([(query, rows)])
+
+    def add_group(self, statements: list) -> None:
+        """Adds (query, rows) statements that are always committed together, never split by a flush."""
+
+        with self._lock:
+            for query, rows in statements:
+                if self._groups and self._groups[-1][0] == query:
+                    self._groups[-1][1].extend(rows)
+                else:
+                    self._groups.append([query, list(rows)])
+                self._count += len(rows)
+            full = self._count >= self.max_rows
+            if self._oldest is None:
+                self._oldest = monotonic()
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_later, name="batch-writer", daemon=True)
+                    self._flusher.start()
+                self._added.notify()
+        if full:
+            self.flush()
+
+    @contextmanager
+    def group(self):
+        """Collects what this thread adds in the block, e.g. a stored article and its index rows, and adds it
+           with add_group() as the block closes. Nothing is added if the block raises."""
+
+        if getattr(self._local, "group", None) is not None:
+            # Nested, part of the outer group.
+            yield
+            return
+        self._local.group = []
+        try:
+            yield
+            statements = self._local.group
+        finally:
+            self._local.group = None
+        self.add_group(statements)
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                groups, self._groups, self._count, self._oldest = self._groups, [], 0, None
+            if not groups:
+                return
+
+            with ConnectionManager(self.database) as cm:
+                for query, rows in groups:
+                    cm.cursor.executemany(query, rows)
+            self.flushes += 1
+
+    def _flush_later(self) -> None:
+        """The flusher thread: flushes each batch once its oldest row has waited max_delay seconds,
+           unless it filled up and was flushed before."""
+
+        while True:
+            with self._added:
+                while self._oldest is None:
+                    self._added.wait()
+                delay = self._oldest + self.max_delay - monotonic()
+                if delay > 0:
+                    self._added.wait(delay)
+                    continue
+            # Nobody is waiting on the flusher thread to hear about a failed write.
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logging.error(f"Batched write failed: {e}", exc_info=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_class, exc, traceback):
+        self.flush()
@@ -0,0 +1,63 @@
+import re
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import sql_manager as sql
+
+# Query parameters that only track where a click came from, never what page it is.
+TRACKING_PARAMS = re.compile(
+    r"^(utm_\w+|fbclid|gclid|dclid|msclkid|mc_cid|mc_eid|ocid|cmpid|ito|ftag|taid|smid|_ga|icid|cid)$", re.IGNORECASE)
+
+
+def canonical_url(url: str) -> str:
+    """Normalises a url so variants of the same article compare equal:
+       lowercase scheme and host, no "www.", no tracking query parameters and no fragment."""
+
+    parts = urlsplit(url.strip())
+    host = re.sub(r"^www\.", "", (parts.hostname or "").lower())
+    if parts.port and parts.port not in (80, 443):
+        host += f":{parts.port}"
+    query = urlencode([(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                       if not TRACKING_PARAMS.match(key)])
+    return urlunsplit((parts.scheme.lower(), host, parts.path or "/", query, ""))
+
+
+class SeenUrlIndex:
+    """Canonical urls of every article already stored or failed, in an indexed table of the database.
+       Lookups go to SQLite instead of a dict of all urls, so memory stays flat however large the archive grows."""
+
+    # Rows per query when filling the index from an existing database.
+    backfill_batch = 5000
+
+    def __init__(self, database: dict, writer: sql.BatchWriter = None) -> None:
+
+        self.db = database
+        # Optional, buffers new urls to be written in batches instead of one transaction each.
+        self.writer = writer
+        sql.execute_query(self.db, "CREATE TABLE IF NOT EXISTS seen_urls(url TEXT PRIMARY KEY) WITHOUT ROWID;")
+        if not sql.execute_query(self.db, "SELECT 1 FROM seen_urls LIMIT 1;"):
+            self.backfill()
+
+    def backfill(self) -> None:
+        """Adds the urls of all stored articles and failed scrapes, a batch at a time."""
+
+        for table in ("articles", "failed_scrapes"):
+            last_rowid = 0
+            while True:
+                rows = sql.execute_query(
+                    self.db, f"SELECT rowid, url FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?;",
+                    (last_rowid, self.backfill_batch))
+                if not rows:
+                    break
+                sql.execute_many(self.db, "INSERT OR IGNORE INTO seen_urls (url) VALUES (?);",
+                                 [(canonical_url(url),) for _, url in rows])
+                last_rowid = rows[-1][0]
+
+    def __contains__(self, url: str) -> bool:
+        return bool(sql.execute_query(self.db, "SELECT 1 FROM seen_urls WHERE url = ?;", (canonical_url(url),)))
+
+    def add(self, url: str) -> None:
+        query = "INSERT OR IGNORE INTO seen_urls (url) VALUES (?);"
+        if self.writer:
+            self.writer.add(query, (canonical_url(url),))
+        else:
+            sql.execute_query(self.db, query, (canonical_url(url),))
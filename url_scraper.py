@@ -1,69 +1,77 @@
-import requests
 from bs4 import BeautifulSoup
 import re
 import logging
 
+from http_client import HttpClient, shared_client
+from page_cache import PageCache
+from fast_parse import iter_hrefs
+from site_profiles import SiteProfile
+
 
 class UrlScraper:
     """Scrapes all article urls on a front page of a news site, based on specific input to finetune the filtering."""
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:98.0) Gecko/20100101 Firefox/98.0",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,/;q=0.8",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Accept-Encoding": "gzip, deflate",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-        "Sec-Fetch-Dest": "document",
-        "Sec-Fetch-Mode": "navigate",
-        "Sec-Fetch-Site": "none",
-        "Sec-Fetch-User": "?1",
-        "Cache-Control": "max-age=0",
-    }
-
-    # This is the generic url blacklist, used to remove any links containg the strings inside.
-    blacklist = [r"mailto:?"]
-    
-    def generator(self, site_url: str, regex_url_match: str = None, url_blacklist: list = None):
-        """Fetches all urls, containing the required partial string, from a site.
+    def __init__(self, client: HttpClient = None, cache: PageCache = None) -> None:
+        # All scrapers share one pooled HTTP client unless given their own.
+        self.client = client or shared_client
+        # Optional validator cache, skipping download and parsing of unchanged front pages.
+        self.cache = cache
+
+    @staticmethod
+    def parse_hrefs(page: str, fast: bool = True) -> list:
+        """Returns all urls on a page, regardless of tag type (at least one site has urls in <h3> tags).
+           fast: stream the hrefs out of lxml's parser instead of building a soup of the whole page."""
+
+        if fast:
+            try:
+                return list(iter_hrefs(page))
+            except Exception as e:
+                logging.warning(f"Fast href parsing failed, falling back to BeautifulSoup: {e}")
+
+        soup = BeautifulSoup(page, "lxml")
+        return [tag["href"] for tag in soup.find_all(href=True)]
+
+    def _fetch_hrefs(self, page_url: str) -> list:
+        """Returns every href on a page, from the cache when the page has not changed since last time."""
+
+        cached = self.cache.lookup(page_url) if self.cache else None
+
+        response = self.client.get(page_url, headers=PageCache.validators(cached))
+        if response.status_code == 304 and cached:
+            self.cache.not_modified += 1
+            return cached["hrefs"]
+        if response.status_code != 200:
+            logging.warning(f"{response.status_code} url")
+
+        body_hash = PageCache.body_hash(response.content)
+        if cached and cached["body_hash"] == body_hash:
+            self.cache.same_body += 1
+            hrefs = cached["hrefs"]
+        else:
+            hrefs = self.parse_hrefs(response.text)
+            if self.cache:
+                self.cache.misses += 1
+
+        if self.cache and response.status_code == 200:
+            self.cache.store(page_url, response, body_hash, hrefs)
+        return hrefs
+
+    def generator(self, site_url: str, profile: SiteProfile):
+        """Fetches all urls of a site's front page that are articles according to the site's profile.
            Domains are to be in the format like: "domain-name.com", without https:// and wwww"""
 
-        if url_blacklist:
-            # Expand the blacklist with site specific blacklist phrases, if any.
-            self.blacklist += url_blacklist
-        
-        # Establish the current sites base domain, for adding to relative urls and making sure of not getting articles from other sites.
+        # Establish the current sites base domain, for adding to relative urls.
         base_domain = re.sub("/.*", "", site_url)
 
         try:
-            response = requests.get("https://" + site_url, headers=self.headers)
-            if response.status_code != 200:
-                logging.warning(f"{response.status_code} url")
-            soup = BeautifulSoup(response.text, "lxml")
+            hrefs = self._fetch_hrefs("https://" + site_url)
         except Exception as e:
             logging.error(e, exc_info=True)
             return
 
-        # Find all urls on the page, regardless of tag type (at least one site has urls in <h3> tags)
-        for url in (tag["href"] for tag in soup.find_all(href=True)):
-            
-            # Don't scrapy any useless urls.
-            if not re.search(rf"^/|^https://(www.)?{base_domain}", url):
-                continue
-                
-            # Exclude site specific phrases in the urls, like "/gallery/" etc.
-            if any(re.search(regex, url) for regex in self.blacklist):
-                continue
-
-            if regex_url_match:
-                # Include only urls containing the required url component for that site, i.e. "/article/".
-                if re.search(regex_url_match, url):
-                    if url.startswith("/"):
-                        url = "https://" + base_domain + url
-                    yield url
-            else:
-                if url.startswith("/"):
-                    url = "https://" + base_domain + url
+        for href in hrefs:
+            url = profile.article_url(href, base_domain)
+            if url:
                 yield url
 
 
@@ -74,33 +82,33 @@ if __name__ == "__main__":
     scr = UrlScraper()
 
     # # No regex-tag TEST
-    # for url in scr.generator("huffpost.com"):
+    # for url in scr.generator("huffpost.com", SiteProfile("huffpost", ["huffpost.com"])):
     #     print(url)
 
     # # HUFFPOST TEST
-    # for url in scr.generator("huffpost.com", r"/entry/", None):
+    # for url in scr.generator("huffpost.com", SiteProfile("huffpost", ["huffpost.com"], r"/entry/")):
     #     print(url)
 
     # # HUFFPOST TEST
-    # for url in scr.generator("huffpost.com", "/entry/"):
+    # for url in scr.generator("huffpost.com", SiteProfile("huffpost", ["huffpost.com"], "/entry/")):
     #     print(url)
 
     # # APNEWS TEST
-    # for url in scr.generator("apnews.com", r"/article/.+", None):
+    # for url in scr.generator("apnews.com", SiteProfile("apnews", ["apnews.com"], r"/article/.+")):
     #     print(url)
 
     # # CNN TEST
-    # for url in scr.generator("edition.cnn.com/world/united-kingdom", r"^/\d+/\d+/\d+/.*", [r".*/gallery/.*"]):
+    # for url in scr.generator("edition.cnn.com/world/united-kingdom", SiteProfile("cnn", ["edition.cnn.com"], r"^/\d+/\d+/\d+/.*", [r".*/gallery/.*"])):
     #     print(url)
 
     # # NEWS.COM.AU TEST
-    # for url in scr.generator("news.com.au", r".*/news-story/.*", None):
+    # for url in scr.generator("news.com.au", SiteProfile("news.com.au", ["news.com.au"], r".*/news-story/.*")):
     #     print(url)
 
     # # LATIMES TEST
-    # for url in scr.generator("latimes.com", r".*/story/.*", None):
+    # for url in scr.generator("latimes.com", SiteProfile("latimes", ["latimes.com"], r".*/story/.*")):
     #     print(url)
 
     # # ALJAZEERA TEST
-    # for url in scr.generator("aljazeera.com", r"/\d+/\d+/\d+/.*", [r".*/gallery/.*", r".*/liveblog/.*"]):
+    # for url in scr.generator("aljazeera.com", SiteProfile("aljazeera", ["aljazeera.com"], r"/\d+/\d+/\d+/.*", [r".*/gallery/.*", r".*/liveblog/.*"])):
     #     print(url)